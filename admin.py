@@ -0,0 +1,32 @@
+"""Access check for the routes that read back submitted contact details.
+
+Listing or exporting messages and geotech requests needs an
+``Authorization: Bearer <ADMIN_TOKEN>`` header. While ADMIN_TOKEN is unset
+those routes answer 403, so the names, emails and phone numbers people send
+in are never public by default; submitting the forms stays open to anyone.
+"""
+
+import os
+import secrets
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def require_admin(credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)) -> None:
+    """Dependency rejecting requests that do not carry the admin bearer token."""
+
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Admin routes are disabled (ADMIN_TOKEN is not set)")
+    if credentials is None or not secrets.compare_digest(credentials.credentials.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401, detail="Missing or invalid admin token", headers={"WWW-Authenticate": "Bearer"}
+        )
+
+
+__all__ = ["ADMIN_TOKEN", "require_admin"]
@@ -1,66 +1,98 @@
 """Routes for managing Background Section paragraphs."""
 
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-import psycopg
-
-from db import get_dsn
-from schemas import Background
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json
+from schemas import Background, BackgroundCreate, BulkDelete, BulkResult
 
 router = APIRouter(prefix="/background", tags=["background"])
 
+_LIST_QUERY = "SELECT id, paragraph FROM background ORDER BY id"
+
 
 @router.get("", response_model=list[Background])
-def list_background() -> list[Background]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, paragraph FROM background ORDER BY id")
-            rows = cur.fetchall()
+async def list_background(request: Request) -> Response:
+    return await cached_response(request, "background", "", _load_background)
+
+
+async def _load_background() -> Union[list[Background], bytes]:
+    if FAST_JSON:
+        return await fetch_json(_LIST_QUERY)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_LIST_QUERY)
+            rows = await cur.fetchall()
     return [Background(id=r[0], paragraph=r[1]) for r in rows]
 
 
 @router.post("", response_model=Background, status_code=201)
-def create_background(paragraph: str = Form(...)) -> Background:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def create_background(paragraph: str = Form(...)) -> Background:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO background (paragraph) VALUES (%s) RETURNING id, paragraph",
                 (paragraph,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create background paragraph")
+    response_cache.invalidate("background")
     return Background(id=row[0], paragraph=row[1])
 
 
 @router.put("/{bg_id}", response_model=Background)
-def update_background(bg_id: int, paragraph: Optional[str] = Form(None)) -> Background:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT paragraph FROM background WHERE id = %s", (bg_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Background paragraph not found")
-            cur.execute(
-                "UPDATE background SET paragraph = %s WHERE id = %s RETURNING id, paragraph",
-                (paragraph if paragraph is not None else current[0], bg_id),
+@router.patch("/{bg_id}", response_model=Background)
+async def update_background(bg_id: int, paragraph: Optional[str] = Form(None)) -> Background:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE background SET paragraph = COALESCE(%s, paragraph) WHERE id = %s RETURNING id, paragraph",
+                (paragraph, bg_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update background paragraph")
+        raise HTTPException(status_code=404, detail="Background paragraph not found")
+    response_cache.invalidate("background")
     return Background(id=row[0], paragraph=row[1])
 
 
 @router.delete("/{bg_id}", status_code=204)
-def delete_background(bg_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM background WHERE id = %s", (bg_id,))
+async def delete_background(bg_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM background WHERE id = %s", (bg_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Background paragraph not found")
+    response_cache.invalidate("background")
     return None
 
 
+_BULK = BulkSpec(
+    "background",
+    BackgroundCreate,
+    "id, paragraph",
+    lambda r: Background(id=r[0], paragraph=r[1]),
+)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201, openapi_extra=bulk_openapi(BackgroundCreate))
+async def bulk_create_background(request: Request) -> BulkResult:
+    return await bulk_insert(_BULK, await read_rows(request, BackgroundCreate))
+
+
+@router.post("/bulk/upsert", response_model=BulkResult, openapi_extra=bulk_openapi(_BULK.upsert_model))
+async def bulk_upsert_background(request: Request) -> BulkResult:
+    return await bulk_upsert(_BULK, await read_rows(request, _BULK.upsert_model))
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_background(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]
@@ -3,19 +3,27 @@
 from typing import Annotated, Optional
 
 from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile
-from fastapi.responses import StreamingResponse
 
-import psycopg
-
-from db import get_dsn
+from cache import cached_response, response_cache
+from db import async_connection
+from images import StoredImage, enqueue_image_jobs, serve_image, store_upload
+from pagination import DEFAULT_PAGE_SIZE, Cursor, Page, PageSize, id_cursor, paginate
 from schemas import Banner
 
 router = APIRouter(prefix="/banners", tags=["banners"])
 
 
+# Banner rows are selected as (id, highlight_tag, title, description, has_image, image_mime);
+# the image itself is only read by the image-preview endpoint.
+_BANNER_COLUMNS = (
+    "id, highlight_tag, title, description,"
+    " (image_key IS NOT NULL OR image IS NOT NULL) AS has_image, image_mime"
+)
+
+
 def _row_to_banner(row: tuple, request: Optional[Request] = None) -> Banner:
     preview_url: Optional[str]
-    if row[4] is not None:
+    if row[4]:
         if request is not None:
             preview_url = str(request.url_for("get_banner_image_preview", banner_id=row[0]))
         else:
@@ -33,54 +41,69 @@ def _row_to_banner(row: tuple, request: Optional[Request] = None) -> Banner:
 
 
 @router.get("", response_model=list[Banner])
-def list_banners(request: Request) -> list[Banner]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, highlight_tag, title, description, image, image_mime FROM banner ORDER BY id"
+async def list_banners(request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None) -> Response:
+    after_id = id_cursor(after)
+    return await cached_response(
+        request, "banner", str(request.base_url), lambda: _load_banners(request, limit, after_id)
+    )
+
+
+async def _load_banners(request: Request, limit: int, after_id: int) -> Page:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT {_BANNER_COLUMNS} FROM banner WHERE id > %s ORDER BY id LIMIT %s", (after_id, limit + 1)
             )
-            rows = cur.fetchall()
-    return [_row_to_banner(row, request) for row in rows]
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: str(r[0]))
+    return Page([_row_to_banner(row, request) for row in rows], next_cursor)
 
 
 @router.post("", response_model=Banner, status_code=201)
-def create_banner(
+async def create_banner(
     request: Request,
     highlight_tag: Annotated[str, Form()],
     title: Annotated[str, Form()],
     image: Annotated[UploadFile, File()],
     description: Annotated[Optional[str], Form()] = None,
 ) -> Banner:
-    file_contents = image.file.read()
-    image.file.close()
-    if not file_contents:
+    stored = await store_upload(image)
+    if stored is None:
         raise HTTPException(status_code=400, detail="Uploaded image file is empty")
-    image_mime = image.content_type or "application/octet-stream"
-
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO banner (highlight_tag, title, description, image, image_mime)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id, highlight_tag, title, description, image, image_mime
+
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                INSERT INTO banner (
+                    highlight_tag, title, description,
+                    image_key, image_mime, image_size, image_sha256, image_updated_at
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING {_BANNER_COLUMNS}
                 """,
                 (
                     highlight_tag,
                     title,
                     description,
-                    psycopg.Binary(file_contents),
-                    image_mime,
+                    stored.key,
+                    stored.mime,
+                    stored.size,
+                    stored.sha256,
+                    stored.updated_at,
                 ),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
+            if row is not None:
+                await enqueue_image_jobs(conn, stored)
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create banner")
+    response_cache.invalidate("banner")
     return _row_to_banner(row, request)
 
 
 @router.put("/{banner_id}", response_model=Banner)
-def update_banner(
+@router.patch("/{banner_id}", response_model=Banner)
+async def update_banner(
     banner_id: int,
     request: Request,
     highlight_tag: Optional[str] = Form(None),
@@ -88,78 +111,64 @@ def update_banner(
     image: UploadFile = File(None),
     description: Optional[str] = Form(None),
 ) -> Banner:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT highlight_tag, title, description, image, image_mime
-                FROM banner
-                WHERE id = %s
-                """,
-                (banner_id,),
-            )
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Banner not found")
-
-            current_highlight, current_title, current_description, current_image, current_mime = current
-
-            if image is not None:
-                file_contents = image.file.read()
-                image.file.close()
-                if not file_contents:
-                    raise HTTPException(status_code=400, detail="Uploaded image file is empty")
-                image_bytes: Optional[psycopg.Binary] = psycopg.Binary(file_contents)
-                image_mime = image.content_type or "application/octet-stream"
-            else:
-                image_bytes = psycopg.Binary(bytes(current_image)) if current_image is not None else None
-                image_mime = current_mime
-
-            cur.execute(
-                """
+    # Leave the stored image untouched (no read, no rewrite) unless a new one is uploaded.
+    stored: Optional[StoredImage] = None
+    if image is not None:
+        stored = await store_upload(image)
+        if stored is None:
+            raise HTTPException(status_code=400, detail="Uploaded image file is empty")
+
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
                 UPDATE banner
-                SET highlight_tag = %s,
-                    title = %s,
-                    description = %s,
-                    image = %s,
-                    image_mime = %s
+                SET highlight_tag = COALESCE(%s, highlight_tag),
+                    title = COALESCE(%s, title),
+                    description = COALESCE(%s, description),
+                    image = CASE WHEN %s THEN NULL ELSE image END,
+                    image_key = COALESCE(%s, image_key),
+                    image_mime = COALESCE(%s, image_mime),
+                    image_size = COALESCE(%s, image_size),
+                    image_sha256 = COALESCE(%s, image_sha256),
+                    image_updated_at = COALESCE(%s, image_updated_at)
                 WHERE id = %s
-                RETURNING id, highlight_tag, title, description, image, image_mime
+                RETURNING {_BANNER_COLUMNS}
                 """,
                 (
-                    highlight_tag if highlight_tag is not None else current_highlight,
-                    title if title is not None else current_title,
-                    description if description is not None else current_description,
-                    image_bytes,
-                    image_mime,
+                    highlight_tag,
+                    title,
+                    description,
+                    stored is not None,
+                    stored and stored.key,
+                    stored and stored.mime,
+                    stored and stored.size,
+                    stored and stored.sha256,
+                    stored and stored.updated_at,
                     banner_id,
                 ),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
+            if row is not None:
+                await enqueue_image_jobs(conn, stored)
     if row is None:
         raise HTTPException(status_code=404, detail="Banner not found")
+    response_cache.invalidate("banner")
     return _row_to_banner(row, request)
 
 
 @router.delete("/{banner_id}", status_code=204)
-def delete_banner(banner_id: int) -> Response:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM banner WHERE id = %s", (banner_id,))
+async def delete_banner(banner_id: int) -> Response:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM banner WHERE id = %s", (banner_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Banner not found")
+    response_cache.invalidate("banner")
     return Response(status_code=204)
 
 
 @router.get("/{banner_id}/image-preview", name="get_banner_image_preview")
-def get_banner_image_preview(banner_id: int) -> StreamingResponse:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT image, image_mime FROM banner WHERE id = %s", (banner_id,))
-            row = cur.fetchone()
-    if row is None or row[0] is None:
-        raise HTTPException(status_code=404, detail="Banner image not found")
-    media_type = row[1] or "application/octet-stream"
-    headers = {"Content-Disposition": "inline"}
-    return StreamingResponse(iter([bytes(row[0])]), media_type=media_type, headers=headers)
+async def get_banner_image_preview(banner_id: int, request: Request) -> Response:
+    return await serve_image(request, "banner", banner_id, "Banner image not found")
 __all__ = ["router"]
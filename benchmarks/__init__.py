@@ -0,0 +1,5 @@
+"""Benchmarks for the Glowac API.
+
+Each module is runnable with ``python -m benchmarks.<name>`` against the
+database configured by DATABASE_URL and prints a JSON summary.
+"""
@@ -0,0 +1,78 @@
+"""Measure the cost of listing banners that carry multi-MB images.
+
+Seeds N banners with random image payloads, then times the listing query with
+the image column selected (the old behaviour) against the presence-flag query
+used by ``GET /banners``, reporting latency and peak Python memory. Seeded rows
+are removed afterwards.
+
+    python -m benchmarks.banner_listing --banners 20 --image-mb 4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+import psycopg
+
+from banner import _BANNER_COLUMNS
+from db import get_dsn
+
+QUERIES = {
+    "with_image_bytes": "SELECT id, highlight_tag, title, description, image, image_mime FROM banner ORDER BY id",
+    "presence_flag": f"SELECT {_BANNER_COLUMNS} FROM banner ORDER BY id",
+}
+
+
+def _measure(conn: psycopg.Connection, query: str, repeat: int) -> dict:
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute(query)
+            cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "p50_ms": statistics.median(timings),
+        "max_ms": max(timings),
+        "peak_python_mb": peak / (1024 * 1024),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--banners", type=int, default=20)
+    parser.add_argument("--image-mb", type=float, default=4.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.image_mb * 1024 * 1024))
+    with psycopg.connect(get_dsn(), autocommit=True) as conn:
+        with conn.cursor() as cur:
+            cur.executemany(
+                "INSERT INTO banner (highlight_tag, title, description, image, image_mime) "
+                "VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                [("bench", f"Benchmark banner {i}", None, payload, "image/jpeg") for i in range(args.banners)],
+                returning=True,
+            )
+            ids = []
+            while True:
+                ids.append(cur.fetchone()[0])
+                if not cur.nextset():
+                    break
+        try:
+            results = {name: _measure(conn, query, args.repeat) for name, query in QUERIES.items()}
+        finally:
+            conn.execute("DELETE FROM banner WHERE id = ANY(%s)", (ids,))
+
+    print(json.dumps({"banners": args.banners, "image_mb": args.image_mb, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
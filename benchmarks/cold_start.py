@@ -0,0 +1,91 @@
+"""Time from process start to the first answered request, eager vs lazy routers.
+
+For each mode, starts the API with uvicorn ``--repeat`` times and measures how
+long it takes until ``GET /health`` answers, then until the first ``--path``
+request (default ``/openapi.json``) answers. ``lazy`` runs with
+LAZY_ROUTERS=1, and ``cold_openapi`` / ``warm_openapi`` start with an empty or
+a pre-built OpenAPI cache directory. The schema check is switched off
+(MIGRATE_ON_STARTUP=off), so no database is needed for the default path.
+It also reports ``import main`` wall time for both router modes.
+
+    python -m benchmarks.cold_start --repeat 5 --path /openapi.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from startup import import_times
+
+
+def _first_response(client: httpx.Client, path: str, started: float) -> float:
+    for _ in range(600):
+        try:
+            client.get(path)
+            return time.perf_counter() - started
+        except httpx.TransportError:
+            time.sleep(0.01)
+    raise SystemExit("server did not start")
+
+
+def _start(port: int, lazy: bool, cache_dir: str, path: str) -> dict:
+    env = {
+        **os.environ,
+        "LAZY_ROUTERS": "1" if lazy else "0",
+        "OPENAPI_CACHE_DIR": cache_dir,
+        "MIGRATE_ON_STARTUP": "off",
+    }
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            ready = _first_response(client, "/health", started)
+            first = time.perf_counter()
+            client.get(path)
+            first_request = time.perf_counter() - first
+    finally:
+        server.terminate()
+        server.wait()
+    return {"ready_ms": ready * 1000, "first_request_ms": first_request * 1000}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--path", default="/openapi.json")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as warm_dir:
+        _start(args.port, False, warm_dir, "/openapi.json")
+        for lazy in (False, True):
+            mode = "lazy" if lazy else "eager"
+            results[f"import_main_ms_{mode}"] = statistics.median(
+                import_times(lazy)[0] * 1000 for _ in range(args.repeat)
+            )
+            for cache in ("cold_openapi", "warm_openapi"):
+                runs = []
+                for _ in range(args.repeat):
+                    if cache == "cold_openapi":
+                        with tempfile.TemporaryDirectory() as cold_dir:
+                            runs.append(_start(args.port, lazy, cold_dir, args.path))
+                    else:
+                        runs.append(_start(args.port, lazy, warm_dir, args.path))
+                results[f"{mode}_{cache}"] = {
+                    key: statistics.median(run[key] for run in runs) for key in ("ready_ms", "first_request_ms")
+                }
+    print(json.dumps({"path": args.path, "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compare request throughput of the blocking and async data layers.
+
+The sync run mirrors the old request path: each simulated request occupies a
+worker thread from a fixed-size pool (FastAPI/AnyIO defaults to 40) while it
+waits on Postgres. The async run keeps ``--concurrency`` requests in flight on
+one event loop. Each run gets a connection per thread or in-flight request, so
+the thread cap, not the pool, limits the sync run; keep ``--concurrency``
+below the server's max_connections.
+
+    python -m benchmarks.db_sync_vs_async --requests 2000 --threads 40 --concurrency 80
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from db import _pool_options, get_dsn
+
+
+def _sized(connections: int) -> dict:
+    return {**_pool_options(), "min_size": connections, "max_size": connections}
+
+
+def _query(sleep_ms: float) -> str:
+    return f"SELECT pg_sleep({sleep_ms / 1000.0}), 1"
+
+
+def run_sync(requests: int, threads: int, sleep_ms: float) -> dict:
+    query = _query(sleep_ms)
+    with ConnectionPool(get_dsn(), open=True, **_sized(threads)) as pool:
+        pool.wait()
+
+        def handle(_: int) -> None:
+            with pool.connection() as conn:
+                conn.execute(query).fetchall()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(handle, range(requests)))
+        elapsed = time.perf_counter() - started
+    return {"mode": "sync", "threads": threads, "seconds": elapsed, "rps": requests / elapsed}
+
+
+async def run_async(requests: int, concurrency: int, sleep_ms: float) -> dict:
+    query = _query(sleep_ms)
+    async with AsyncConnectionPool(get_dsn(), open=False, **_sized(concurrency)) as pool:
+        await pool.wait()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def handle() -> None:
+            async with limit:
+                async with pool.connection() as conn:
+                    cur = await conn.execute(query)
+                    await cur.fetchall()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(handle() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    return {"mode": "async", "concurrency": concurrency, "seconds": elapsed, "rps": requests / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=40, help="worker threads for the sync run")
+    parser.add_argument("--concurrency", type=int, default=80, help="in-flight requests for the async run")
+    parser.add_argument("--query-ms", type=float, default=5.0, help="server-side latency per query")
+    args = parser.parse_args()
+
+    results = [
+        run_sync(args.requests, args.threads, args.query_ms),
+        asyncio.run(run_async(args.requests, args.concurrency, args.query_ms)),
+    ]
+    pools = {"sync": args.threads, "async": args.concurrency}
+    print(json.dumps({"requests": args.requests, "pool_connections": pools, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Peak server RSS while many clients download images concurrently.
+
+Starts the API with uvicorn in a subprocess, fires ``--concurrency`` parallel
+downloads of the given image paths (by default every gallery image listed by
+``GET /gallery``) and reports throughput plus the server's peak resident set
+size (VmHWM from /proc, so Linux only).
+
+    python -m benchmarks.image_downloads --concurrency 50 --rounds 4
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+
+def _peak_rss_mb(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def _wait_until_up(client: httpx.AsyncClient) -> None:
+    for _ in range(100):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise SystemExit("server did not start")
+
+
+async def _run(base_url: str, paths: list[str], concurrency: int, rounds: int, pid: int) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await _wait_until_up(client)
+        if not paths:
+            paths = [item["image_preview_url"] for item in (await client.get("/gallery")).json()]
+        if not paths:
+            raise SystemExit("no images to download; seed the gallery or pass --path")
+        baseline = _peak_rss_mb(pid)
+        downloaded = 0
+
+        async def download(path: str) -> None:
+            nonlocal downloaded
+            async with client.stream("GET", path) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    downloaded += len(chunk)
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*(download(paths[i % len(paths)]) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "downloads": concurrency * rounds,
+        "seconds": elapsed,
+        "mb_per_second": downloaded / (1024 * 1024) / elapsed,
+        "baseline_peak_rss_mb": baseline,
+        "peak_rss_mb": _peak_rss_mb(pid),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", action="append", default=[], help="image path to download (repeatable)")
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"]
+    )
+    try:
+        result = asyncio.run(
+            _run(f"http://127.0.0.1:{args.port}", args.path, args.concurrency, args.rounds, server.pid)
+        )
+    finally:
+        server.terminate()
+        server.wait()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
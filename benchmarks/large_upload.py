@@ -0,0 +1,90 @@
+"""Server memory while uploading an image much larger than the memory budget.
+
+Starts the API with uvicorn in a subprocess (MAX_UPLOAD_BYTES raised to fit
+the test file), streams a ``--size-mb`` gallery upload to it, then checks that
+a file just over the limit is refused with 413. Exits non-zero when the
+server's peak resident set size (VmHWM from /proc, so Linux only) grows by
+more than ``--max-rss-mb`` during the upload.
+
+    python -m benchmarks.large_upload --size-mb 512 --max-rss-mb 64
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.image_downloads import _peak_rss_mb
+
+
+def _wait_until_up(client: httpx.Client) -> None:
+    for _ in range(100):
+        try:
+            if client.get("/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit("server did not start")
+
+
+def _sparse_file(size: int):
+    handle = tempfile.TemporaryFile()
+    handle.truncate(size)
+    return handle
+
+
+def _upload(client: httpx.Client, size: int) -> httpx.Response:
+    with _sparse_file(size) as handle:
+        return client.post("/gallery", files={"image": ("large.bin", handle, "application/octet-stream")})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--max-rss-mb", type=float, default=64)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    env = {**os.environ, "MAX_UPLOAD_BYTES": str(size)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=600) as client:
+            _wait_until_up(client)
+            baseline = _peak_rss_mb(server.pid)
+            started = time.perf_counter()
+            accepted = _upload(client, size)
+            elapsed = time.perf_counter() - started
+            peak = _peak_rss_mb(server.pid)
+            rejected = _upload(client, size + 1)
+            if accepted.status_code == 201:
+                client.delete(f"/gallery/{accepted.json()['id']}")
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {
+        "upload_mb": args.size_mb,
+        "seconds": elapsed,
+        "status": accepted.status_code,
+        "oversized_status": rejected.status_code,
+        "baseline_peak_rss_mb": baseline,
+        "peak_rss_mb": peak,
+        "rss_growth_mb": peak - baseline,
+    }
+    print(json.dumps(result, indent=2))
+    if accepted.status_code != 201 or rejected.status_code != 413 or peak - baseline > args.max_rss_mb:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
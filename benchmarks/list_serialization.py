@@ -0,0 +1,128 @@
+"""Encode 10k-row lists with a model per row vs the FAST_JSON dict-row path.
+
+Builds ``--rows`` rows shaped like the ones psycopg returns for ``GET /facts``
+and ``GET /sub-services/by-main/{id}`` (tuples for the model path, dicts for
+the fast path) and times, per list:
+
+- ``fastapi_response_model``: models validated again by a ``response_model``
+  and encoded (what FastAPI does when a handler returns the models)
+- ``models``: a model per row encoded with pydantic-core (the current path)
+- ``dict_rows``: the dict rows encoded by ``fast_json.dumps``
+
+and checks that the last two bodies are identical. With ``--db`` it also
+seeds that many facts and times ``facts._load_facts`` end to end both ways
+(seeded rows are removed afterwards).
+
+    python -m benchmarks.list_serialization --rows 10000 --repeat 20 --db
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+
+import fast_json
+from schemas import Fact, SubService
+
+MARKER = "list-serialization-bench"
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": statistics.median(timings), "min_ms": min(timings)}
+
+
+def _compare(model: Any, tuples: List[tuple], dicts: List[dict], build: Callable[[tuple], Any], repeat: int) -> dict:
+    adapter = TypeAdapter(list[model])
+
+    def models() -> bytes:
+        return to_json([build(r) for r in tuples])
+
+    def response_model() -> bytes:
+        return adapter.dump_json(adapter.validate_python([build(r) for r in tuples], from_attributes=True))
+
+    return {
+        "fastapi_response_model": _time(response_model, repeat),
+        "models": _time(models, repeat),
+        "dict_rows": _time(lambda: fast_json.dumps(dicts), repeat),
+        "identical": models() == fast_json.dumps(dicts),
+        "body_bytes": len(models()),
+    }
+
+
+async def _end_to_end(rows: int, repeat: int) -> dict:
+    import facts
+    from db import async_connection, close_async_pool
+
+    async with async_connection() as conn:
+        await conn.execute(
+            "INSERT INTO facts (label, number, status) SELECT %s, g, 'Visible' FROM generate_series(1, %s) AS g",
+            (MARKER, rows),
+        )
+    results = {}
+    try:
+        for fast in (False, True):
+            facts.FAST_JSON = fast
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = await facts._load_facts()
+                # the step cached_response takes to turn the result into a body
+                if not isinstance(result, bytes):
+                    to_json(result)
+                timings.append((time.perf_counter() - started) * 1000)
+            results["dict_rows" if fast else "models"] = {
+                "median_ms": statistics.median(timings),
+                "min_ms": min(timings),
+            }
+    finally:
+        async with async_connection() as conn:
+            await conn.execute("DELETE FROM facts WHERE label = %s", (MARKER,))
+        await close_async_pool()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", action="store_true", help="also time GET /facts loading against DATABASE_URL")
+    args = parser.parse_args()
+
+    fact_rows = [(i, f"Projects completed {i}", i * 7, "Visible") for i in range(1, args.rows + 1)]
+    sub_rows = [
+        (i, i // 50 + 1, f"Soil investigation {i}", None if i % 3 else "Boreholes") for i in range(1, args.rows + 1)
+    ]
+    results = {
+        "facts": _compare(
+            Fact,
+            fact_rows,
+            [{"id": r[0], "label": r[1], "number": str(r[2]), "status": r[3]} for r in fact_rows],
+            lambda r: Fact(id=r[0], label=r[1], number=str(r[2]) if r[2] is not None else "", status=r[3]),
+            args.repeat,
+        ),
+        "sub_services": _compare(
+            SubService,
+            sub_rows,
+            [{"id": r[0], "main_service_id": r[1], "service_name": r[2], "description": r[3]} for r in sub_rows],
+            lambda r: SubService(id=r[0], main_service_id=r[1], service_name=r[2], description=r[3]),
+            args.repeat,
+        ),
+    }
+    if args.db:
+        results["facts_end_to_end"] = asyncio.run(_end_to_end(args.rows, args.repeat))
+    summary = {"rows": args.rows, "repeat": args.repeat, "encoder": "orjson" if fast_json.orjson else "pydantic-core"}
+    print(json.dumps({**summary, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
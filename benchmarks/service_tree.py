@@ -0,0 +1,114 @@
+"""Compare the per-level fan-out of the services page against ``GET /services/tree``.
+
+Seeds ``--mains`` main services with ``--subs`` sub-services each and
+``--tests`` tests per sub-service (50 x 20 x 10 by default). It then times:
+
+* ``n_plus_one``: the queries the frontend used to trigger. That is one query
+  for the main services, one per main service for its sub-services and one per
+  sub-service for its tests, all on a single connection. This is the most
+  favourable case: over HTTP each one also paid a request and a pool checkout.
+* ``tree``: the single json_agg query behind ``/services/tree``.
+
+Seeded rows are removed afterwards (sub-services and tests cascade).
+
+    python -m benchmarks.service_tree --mains 50 --subs 20 --tests 10
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import psycopg
+from psycopg import sql
+
+from db import get_dsn
+from services import _TREE_QUERY
+
+
+def _n_plus_one(conn: psycopg.Connection, main_ids: list) -> int:
+    queries = 1
+    mains = conn.execute(
+        "SELECT id, service_name FROM main_service WHERE id = ANY(%s) ORDER BY id", (main_ids,)
+    ).fetchall()
+    for main_id, _ in mains:
+        subs = conn.execute(
+            "SELECT id, main_service_id, service_name, description FROM sub_service"
+            " WHERE main_service_id = %s ORDER BY id",
+            (main_id,),
+        ).fetchall()
+        queries += 1
+        for sub in subs:
+            conn.execute(
+                "SELECT id, main_service_id, sub_service_id, test_name, description FROM service_test"
+                " WHERE sub_service_id = %s ORDER BY id",
+                (sub[0],),
+            ).fetchall()
+            queries += 1
+    return queries
+
+
+def _tree(conn: psycopg.Connection, main_ids: list) -> int:
+    conn.execute(_TREE_QUERY.format(where=sql.SQL("WHERE m.id = ANY(%s)")), (main_ids,)).fetchone()
+    return 1
+
+
+def _measure(fn, conn: psycopg.Connection, main_ids: list, repeat: int) -> dict:
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        queries = fn(conn, main_ids)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"queries": queries, "p50_ms": statistics.median(timings), "max_ms": max(timings)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mains", type=int, default=50)
+    parser.add_argument("--subs", type=int, default=20)
+    parser.add_argument("--tests", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with psycopg.connect(get_dsn(), autocommit=True) as conn:
+        main_ids = [
+            r[0]
+            for r in conn.execute(
+                "INSERT INTO main_service (service_name)"
+                " SELECT 'Benchmark main ' || g FROM generate_series(1, %s) g RETURNING id",
+                (args.mains,),
+            ).fetchall()
+        ]
+        try:
+            subs = conn.execute(
+                """
+                INSERT INTO sub_service (main_service_id, service_name, description)
+                SELECT m, 'Benchmark sub ' || g, 'Seeded by benchmarks.service_tree'
+                FROM unnest(%s::bigint[]) AS m, generate_series(1, %s) AS g
+                RETURNING id, main_service_id
+                """,
+                (main_ids, args.subs),
+            ).fetchall()
+            conn.execute(
+                """
+                INSERT INTO service_test (main_service_id, sub_service_id, test_name, description)
+                SELECT s.main_id, s.sub_id, 'Benchmark test ' || g, 'Seeded by benchmarks.service_tree'
+                FROM unnest(%s::bigint[], %s::bigint[]) AS s(sub_id, main_id), generate_series(1, %s) AS g
+                """,
+                ([s[0] for s in subs], [s[1] for s in subs], args.tests),
+            )
+            conn.execute("ANALYZE main_service, sub_service, service_test")
+            results = {
+                "n_plus_one": _measure(_n_plus_one, conn, main_ids, args.repeat),
+                "tree": _measure(_tree, conn, main_ids, args.repeat),
+            }
+        finally:
+            conn.execute("DELETE FROM main_service WHERE id = ANY(%s)", (main_ids,))
+
+    shape = {"mains": args.mains, "subs_per_main": args.subs, "tests_per_sub": args.tests}
+    print(json.dumps({**shape, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""Content-addressed storage for uploaded images.
+
+Blobs are keyed by the SHA-256 of their content, so identical uploads share a
+single stored object and keys never need rewriting. The backend is chosen with
+BLOB_STORE_BACKEND:
+
+* ``local`` (default): files under BLOB_STORE_PATH (default ``./blobs``),
+  sharded as ``ab/cd/abcd...``.
+* ``s3``: objects in S3_BUCKET under S3_PREFIX, using S3_ENDPOINT_URL when set
+  so a local S3-compatible server can stand in. Requires ``boto3``.
+
+Run ``python blobstore.py migrate`` once to move existing BYTEA images out of
+Postgres, and ``python blobstore.py gc`` to delete blobs no row references.
+"""
+
+import abc
+import argparse
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+# Tables whose image_key columns point into the blob store.
+IMAGE_TABLES = ("banner", "ceo_card", "members", "gallery")
+
+
+class BlobTooLarge(Exception):
+    """Raised by ``put_file`` when the content exceeds the allowed size."""
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__(f"blob exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
+class BlobInfo(NamedTuple):
+    key: str
+    size: int
+    sha256: str
+
+
+class BlobStore(abc.ABC):
+    """Interface shared by the storage backends."""
+
+    @abc.abstractmethod
+    def put_file(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> BlobInfo:
+        """Store the remaining content of *fileobj*, reading it in chunks.
+
+        Raises BlobTooLarge, without storing anything, once more than *max_size*
+        bytes have been read.
+        """
+
+    def put_bytes(self, data: bytes) -> BlobInfo:
+        with tempfile.SpooledTemporaryFile(max_size=len(data) + 1) as spool:
+            spool.write(data)
+            spool.seek(0)
+            return self.put_file(spool)
+
+    @abc.abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        ...
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        """Yield bytes ``[start, end)`` of the blob in CHUNK_SIZE pieces."""
+
+        with self.open(key) as stream:
+            stream.seek(start)
+            yield from _read_chunks(stream, end - start)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Return a filesystem path for *key* when the backend has one (enables sendfile)."""
+
+        return None
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def keys(self) -> Iterator[str]:
+        ...
+
+
+def _copy_hashing(src: BinaryIO, dst: BinaryIO, max_size: Optional[int] = None) -> BlobInfo:
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise BlobTooLarge(max_size)
+        digest.update(chunk)
+        dst.write(chunk)
+    sha256 = digest.hexdigest()
+    return BlobInfo(key=sha256, size=size, sha256=sha256)
+
+
+def _read_chunks(stream: BinaryIO, remaining: int) -> Iterator[bytes]:
+    while remaining > 0:
+        chunk = stream.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._tmp = root / "tmp"
+        self._tmp.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def put_file(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> BlobInfo:
+        fd, tmp_name = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                info = _copy_hashing(fileobj, tmp, max_size)
+            target = self._path(info.key)
+            if target.exists():
+                os.unlink(tmp_name)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_name, target)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        return info
+
+    def open(self, key: str) -> BinaryIO:
+        return self._path(key).open("rb")
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def keys(self) -> Iterator[str]:
+        for path in self.root.glob("??/??/*"):
+            if path.is_file():
+                yield path.name
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None) -> None:
+        try:
+            import boto3
+        except ImportError as exc:  # pragma: no cover - optional dependency
+            raise SystemExit("BLOB_STORE_BACKEND=s3 requires boto3; install it with 'pip install boto3'.") from exc
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put_file(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> BlobInfo:
+        # The key is the content hash, so spool to disk while hashing before uploading.
+        with tempfile.TemporaryFile() as spool:
+            info = _copy_hashing(fileobj, spool, max_size)
+            if not self.exists(info.key):
+                spool.seek(0)
+                self._client.upload_fileobj(spool, self.bucket, self._object_key(info.key))
+        return info
+
+    def open(self, key: str) -> BinaryIO:
+        return self._client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+
+    def iter_range(self, key: str, start: int, end: int) -> Iterator[bytes]:
+        if end <= start:
+            return
+        response = self._client.get_object(
+            Bucket=self.bucket, Key=self._object_key(key), Range=f"bytes={start}-{end - 1}"
+        )
+        body = response["Body"]
+        try:
+            yield from _read_chunks(body, end - start)
+        finally:
+            body.close()
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            return False
+        return True
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def keys(self) -> Iterator[str]:
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):]
+
+
+_STORE: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store configured from the environment."""
+
+    global _STORE
+    if _STORE is None:
+        backend = (os.getenv("BLOB_STORE_BACKEND") or "local").lower()
+        if backend == "local":
+            _STORE = LocalBlobStore(Path(os.getenv("BLOB_STORE_PATH") or "blobs").resolve())
+        elif backend == "s3":
+            bucket = os.getenv("S3_BUCKET")
+            if not bucket:
+                raise SystemExit("BLOB_STORE_BACKEND=s3 requires S3_BUCKET.")
+            _STORE = S3BlobStore(bucket, os.getenv("S3_PREFIX") or "", os.getenv("S3_ENDPOINT_URL"))
+        else:
+            raise SystemExit(f"Unknown BLOB_STORE_BACKEND {backend!r}; expected 'local' or 's3'.")
+    return _STORE
+
+
+def migrate_bytea(batch_size: int = 50) -> int:
+    """Move BYTEA images into the blob store, one row per transaction."""
+
+    from psycopg import sql
+
+    from db import connection
+
+    store = get_blob_store()
+    moved = 0
+    for table in IMAGE_TABLES:
+        ident = sql.Identifier(table)
+        while True:
+            with connection() as conn:
+                ids = [
+                    r[0]
+                    for r in conn.execute(
+                        sql.SQL(
+                            "SELECT id FROM {} WHERE image IS NOT NULL AND image_key IS NULL ORDER BY id LIMIT %s"
+                        ).format(ident),
+                        (batch_size,),
+                    ).fetchall()
+                ]
+            if not ids:
+                break
+            for row_id in ids:
+                with connection() as conn:
+                    row = conn.execute(
+                        sql.SQL("SELECT image FROM {} WHERE id = %s AND image_key IS NULL FOR UPDATE").format(ident),
+                        (row_id,),
+                    ).fetchone()
+                    if row is None or row[0] is None:
+                        continue
+                    info = store.put_bytes(bytes(row[0]))
+                    conn.execute(
+                        sql.SQL(
+                            """
+                            UPDATE {}
+                            SET image_key = %s,
+                                image_size = %s,
+                                image_sha256 = %s,
+                                image_updated_at = COALESCE(image_updated_at, NOW()),
+                                image = NULL
+                            WHERE id = %s
+                            """
+                        ).format(ident),
+                        (info.key, info.size, info.sha256, row_id),
+                    )
+                moved += 1
+                print(f"{table} #{row_id}: {info.size} bytes -> {info.key}")
+    return moved
+
+
+def collect_garbage(dry_run: bool = False) -> int:
+    """Delete stored blobs that no table row or image variant references any more.
+
+    Run it while no uploads are in flight: a blob written by an upload whose
+    row has not been committed yet looks unreferenced.
+    """
+
+    from psycopg import sql
+
+    from db import connection
+
+    with connection() as conn:
+        referenced = set()
+        sources = set()
+        for table in IMAGE_TABLES:
+            rows = conn.execute(
+                sql.SQL("SELECT DISTINCT image_key, image_sha256 FROM {} WHERE image_sha256 IS NOT NULL").format(
+                    sql.Identifier(table)
+                )
+            ).fetchall()
+            referenced.update(r[0] for r in rows if r[0] is not None)
+            sources.update(r[1] for r in rows)
+        # variants of images that no row uses any more are dropped along with their blobs
+        variants = conn.execute("SELECT source_sha256, width, format, blob_key FROM image_variants").fetchall()
+        for source_sha256, width, fmt, key in variants:
+            if source_sha256 in sources:
+                referenced.add(key)
+            elif not dry_run:
+                conn.execute(
+                    "DELETE FROM image_variants WHERE source_sha256 = %s AND width = %s AND format = %s",
+                    (source_sha256, width, fmt),
+                )
+    store = get_blob_store()
+    removed = 0
+    for key in list(store.keys()):
+        if key not in referenced:
+            if not dry_run:
+                store.delete(key)
+            removed += 1
+    return removed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the image blob store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="move BYTEA images out of Postgres")
+    migrate.add_argument("--batch-size", type=int, default=50)
+    gc = commands.add_parser("gc", help="delete unreferenced blobs")
+    gc.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(f"Moved {migrate_bytea(args.batch_size)} images to the blob store.")
+    else:
+        print(f"{'Would remove' if args.dry_run else 'Removed'} {collect_garbage(args.dry_run)} blobs.")
+
+
+__all__ = ["BlobInfo", "BlobStore", "BlobTooLarge", "IMAGE_TABLES", "LocalBlobStore", "S3BlobStore", "get_blob_store"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Bulk create, upsert and delete for the content routers.
+
+``POST .../bulk`` and ``POST .../bulk/upsert`` take a JSON array, NDJSON
+(``application/x-ndjson``) or CSV with a header row (``text/csv``); at most
+BULK_MAX_ROWS (default 10000) rows and BULK_MAX_BYTES (default 16 MiB) per
+request. Every row is validated before
+the database is touched, then all rows are written in one transaction with a
+single pipelined ``executemany``. If any row fails (invalid, or its parent row
+does not exist) nothing is written and the 422 response lists the failing
+rows. ``POST .../bulk/delete`` takes ``{"ids": [...]}``.
+"""
+
+import csv
+import io
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+
+import psycopg
+from fastapi import HTTPException, Request
+from psycopg import sql
+from pydantic import BaseModel, ValidationError, create_model
+
+from cache import response_cache
+from db import async_connection
+from schemas import BulkResult, BulkRowResult
+
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS") or 10000)
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES") or 16 * 1024 * 1024)
+
+_CSV_TYPES = {"text/csv", "application/csv"}
+_NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+
+class BulkSpec:
+    """How rows of *model* are written to *table*.
+
+    *values* maps a column to the SQL expression producing it (default
+    ``%(column)s``) and *source* is an optional ``FROM ... WHERE ...`` clause
+    those expressions can read from, e.g. to look up a parent row; a row for
+    which *source* matches nothing is reported as ``not_found``.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        model: Type[BaseModel],
+        returning: str,
+        build: Callable[[tuple], BaseModel],
+        values: Optional[Dict[str, str]] = None,
+        source: str = "",
+        invalidates: Sequence[str] = (),
+    ) -> None:
+        self.table = table
+        self.model = model
+        self.upsert_model = create_model(f"{model.__name__}Upsert", __base__=model, id=(Optional[int], None))
+        self.build = build
+        self.invalidates = (table, *invalidates)
+        columns = [name for name in model.model_fields if name not in (values or {})] + list(values or {})
+        exprs = sql.SQL(", ").join(sql.SQL((values or {}).get(c, f"%({c})s")) for c in columns)
+        ident = sql.Identifier(table)
+        column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+        self.insert_sql = sql.SQL("INSERT INTO {} ({}) SELECT {} {} RETURNING {}").format(
+            ident, column_list, exprs, sql.SQL(source), sql.SQL(returning)
+        )
+        self.upsert_sql = sql.SQL(
+            "INSERT INTO {} (id, {}) SELECT COALESCE(%(id)s::bigint, nextval(pg_get_serial_sequence({}, 'id'))), {} {}"
+            " ON CONFLICT (id) DO UPDATE SET {} RETURNING {}, (xmax = 0)"
+        ).format(
+            ident,
+            column_list,
+            sql.Literal(table),
+            exprs,
+            sql.SQL(source),
+            sql.SQL(", ").join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c)) for c in columns),
+            sql.SQL(returning),
+        )
+
+
+def _body_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Request body exceeds {BULK_MAX_BYTES} bytes")
+
+
+async def _read_body(request: Request) -> bytes:
+    # UploadLimitMiddleware only covers multipart bodies; stop reading these at the cap too
+    declared = request.headers.get("content-length", "")
+    if declared.isascii() and declared.isdigit() and int(declared) > BULK_MAX_BYTES:
+        raise _body_too_large()
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > BULK_MAX_BYTES:
+            raise _body_too_large()
+    return bytes(body)
+
+
+def _records(content_type: str, body: bytes) -> List[Any]:
+    if content_type in _CSV_TYPES:
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        # empty cells fall back to the field default (or fail validation when required)
+        return [{k: v for k, v in row.items() if k and v not in ("", None)} for row in reader]
+    if content_type in _NDJSON_TYPES:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    records = json.loads(body)
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of rows")
+    return records
+
+
+async def read_rows(request: Request, model: Type[BaseModel], extra: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """Parse and validate the request body as rows of *model*, merging *extra* into every row."""
+
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    body = await _read_body(request)
+    try:
+        records = _records(content_type, body)
+    except (ValueError, csv.Error) as exc:
+        raise HTTPException(status_code=400, detail=f"Could not parse request body: {exc}")
+    if len(records) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ROWS} rows per request")
+
+    rows, failures = [], []
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise ValueError("row must be an object")
+            rows.append(model.model_validate({**record, **(extra or {})}))
+        except ValidationError as exc:
+            failures.append(BulkRowResult(index=index, status="invalid", errors=json.loads(exc.json(include_url=False))))
+        except ValueError as exc:
+            failures.append(BulkRowResult(index=index, status="invalid", errors=[str(exc)]))
+    if failures:
+        raise HTTPException(status_code=422, detail=BulkResult(failed=len(failures), results=failures).model_dump())
+    return rows
+
+
+async def _executemany(cur: psycopg.AsyncCursor, query: sql.Composable, rows: List[BaseModel]) -> List[Optional[tuple]]:
+    await cur.executemany(query, [row.model_dump() for row in rows], returning=True)
+    returned = []
+    while True:
+        returned.append(await cur.fetchone())
+        if not cur.nextset():
+            break
+    return returned
+
+
+def _finish(spec: BulkSpec, results: List[BulkRowResult]) -> BulkResult:
+    for table in spec.invalidates:
+        response_cache.invalidate(table)
+    return BulkResult(
+        created=sum(r.status == "created" for r in results),
+        updated=sum(r.status == "updated" for r in results),
+        deleted=sum(r.status == "deleted" for r in results),
+        results=results,
+    )
+
+
+def _not_found(results: List[BulkRowResult]) -> HTTPException:
+    failed = [r for r in results if r.status == "not_found"]
+    return HTTPException(status_code=422, detail=BulkResult(failed=len(failed), results=failed).model_dump())
+
+
+async def bulk_insert(spec: BulkSpec, rows: List[BaseModel]) -> BulkResult:
+    if not rows:
+        return BulkResult(results=[])
+    async with async_connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                returned = await _executemany(cur, spec.insert_sql, rows)
+            results = [
+                BulkRowResult(index=i, status="not_found")
+                if r is None
+                else BulkRowResult(index=i, status="created", id=r[0], item=spec.build(r))
+                for i, r in enumerate(returned)
+            ]
+            if any(r.status == "not_found" for r in results):
+                raise _not_found(results)
+    return _finish(spec, results)
+
+
+async def bulk_upsert(spec: BulkSpec, rows: List[BaseModel]) -> BulkResult:
+    """Update the rows whose ``id`` exists and insert the others (keeping a given ``id``)."""
+
+    if not rows:
+        return BulkResult(results=[])
+    async with async_connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                returned = await _executemany(cur, spec.upsert_sql, rows)
+            results = [
+                BulkRowResult(index=i, status="not_found")
+                if r is None
+                else BulkRowResult(index=i, status="created" if r[-1] else "updated", id=r[0], item=spec.build(r[:-1]))
+                for i, r in enumerate(returned)
+            ]
+            if any(r.status == "not_found" for r in results):
+                raise _not_found(results)
+            if any(getattr(row, "id", None) is not None for row in rows):
+                # explicit ids bypass the sequence; move it past them so later inserts do not collide
+                await conn.execute(
+                    sql.SQL(
+                        "SELECT setval(pg_get_serial_sequence({0}, 'id'), max(id)) FROM {1} HAVING max(id) >"
+                        " COALESCE(pg_sequence_last_value(pg_get_serial_sequence({0}, 'id')::regclass), 0)"
+                    ).format(sql.Literal(spec.table), sql.Identifier(spec.table))
+                )
+    return _finish(spec, results)
+
+
+async def bulk_delete(spec: BulkSpec, ids: List[int]) -> BulkResult:
+    if len(ids) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ROWS} rows per request")
+    async with async_connection() as conn:
+        cur = await conn.execute(
+            sql.SQL("DELETE FROM {} WHERE id = ANY(%s) RETURNING id").format(sql.Identifier(spec.table)), (ids,)
+        )
+        deleted = {row[0] for row in await cur.fetchall()}
+    results = [
+        BulkRowResult(index=i, id=id_, status="deleted" if id_ in deleted else "not_found") for i, id_ in enumerate(ids)
+    ]
+    return _finish(spec, results)
+
+
+def bulk_openapi(model: Type[BaseModel]) -> Dict[str, Any]:
+    """``openapi_extra`` documenting the accepted bulk body formats."""
+
+    row = model.model_json_schema()
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": {"type": "array", "items": row}},
+                "application/x-ndjson": {"schema": row},
+                "text/csv": {"schema": {"type": "string"}},
+            },
+        }
+    }
+
+
+__all__ = [
+    "BULK_MAX_BYTES",
+    "BULK_MAX_ROWS",
+    "BulkSpec",
+    "bulk_delete",
+    "bulk_insert",
+    "bulk_openapi",
+    "bulk_upsert",
+    "read_rows",
+]
@@ -0,0 +1,211 @@
+"""In-process cache for serialized list responses.
+
+Entries are grouped by resource (the backing table name) so write handlers can
+drop everything derived from a table with ``response_cache.invalidate(table)``.
+Writes served by other workers arrive through Postgres NOTIFY and are applied
+by ``listen_for_invalidations``. Sizing is controlled by LIST_CACHE_TTL
+(seconds, 0 disables caching) and LIST_CACHE_MAX_ENTRIES.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Mapping, Optional, Sequence, Set, Tuple, Union
+
+import psycopg
+from fastapi import Request, Response
+from pydantic_core import to_json
+
+from db import CHANGE_CHANNEL_SUFFIX, change_channel, get_dsn
+from http_cache import LIST_CACHE_CONTROL, etag_matches, make_etag, not_modified
+from pagination import Page, page_headers
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Tables whose writes are announced by the notify_table_change() trigger.
+CACHED_TABLES = (
+    "banner",
+    "tus",
+    "facts",
+    "why_choose_us",
+    "background",
+    "core_values",
+    "gallery",
+    "ceo_card",
+    "members",
+    "main_service",
+    "sub_service",
+    "service_test",
+)
+
+
+class ResponseCache:
+    """Size-bounded LRU of (body, etag, headers) entries with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, bytes, str, Dict[str, str]]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def generation(self, resource: str) -> int:
+        """Return a counter bumped on every invalidation of *resource*."""
+
+        return self._generations.get(resource, 0)
+
+    def get(self, resource: str, key: str) -> Optional[Tuple[bytes, str, Dict[str, str]]]:
+        entry = self._entries.get((resource, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, body, etag, headers = entry
+        if expires_at <= time.monotonic():
+            del self._entries[(resource, key)]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end((resource, key))
+        self.hits += 1
+        return body, etag, headers
+
+    def set(
+        self,
+        resource: str,
+        key: str,
+        body: bytes,
+        etag: str,
+        generation: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Store *body*, unless *resource* was invalidated since *generation* was read."""
+
+        if not self.enabled:
+            return
+        if generation is not None and generation != self.generation(resource):
+            return
+        self._entries[(resource, key)] = (time.monotonic() + self.ttl, body, etag, headers or {})
+        self._entries.move_to_end((resource, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def depends_on(self, resource: str, tables: Iterable[str]) -> None:
+        """Invalidate *resource*, a response built from several tables, whenever one of *tables* is."""
+
+        for table in tables:
+            self._dependents.setdefault(table, set()).add(resource)
+
+    def invalidate(self, resource: str) -> None:
+        """Drop every entry cached for *resource* and for the resources depending on it."""
+
+        self._generations[resource] = self.generation(resource) + 1
+        for entry_key in [k for k in self._entries if k[0] == resource]:
+            del self._entries[entry_key]
+        self.invalidations += 1
+        for dependent in self._dependents.get(resource, ()):
+            self.invalidate(dependent)
+
+    def clear(self) -> None:
+        for resource in {k[0] for k in self._entries}:
+            self._generations[resource] = self.generation(resource) + 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("LIST_CACHE_MAX_ENTRIES") or 256),
+    ttl=float(os.getenv("LIST_CACHE_TTL") or 60),
+)
+
+
+async def cached_response(
+    request: Request,
+    resource: str,
+    key: str,
+    load: Callable[[], Awaitable[Union[Sequence[Any], Mapping[str, Any], Page, bytes]]],
+) -> Response:
+    """Serve the JSON list (or object) produced by *load*, reusing the cached body when fresh.
+
+    The body's content hash is sent as a strong ETag and a matching
+    If-None-Match is answered with 304. Entries are cached per query string;
+    when *load* returns a Page its next-page headers are cached with the body.
+    *load* may also return an already serialized JSON body as bytes, alone or
+    as the items of a Page (see fast_json.py).
+    """
+
+    key = f"{key}?{request.url.query}"
+    cached = response_cache.get(resource, key)
+    if cached is None:
+        generation = response_cache.generation(resource)
+        # "load" covers the queries and building the models, "serialize" the JSON encoding
+        with span("load", {"cache.resource": resource}):
+            result = await load()
+        extra: Dict[str, str] = {}
+        if isinstance(result, Page):
+            extra = page_headers(request, result.next_cursor)
+            result = result.items
+        with span("serialize") as current:
+            body = result if isinstance(result, bytes) else to_json(result)
+            if current is not None:
+                current.set_attribute("http.response.body.size", len(body))
+        etag = make_etag(body)
+        response_cache.set(resource, key, body, etag, generation, extra)
+    else:
+        body, etag, extra = cached
+    headers = {**extra, "ETag": etag, "Cache-Control": LIST_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return not_modified(headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def listen_for_invalidations(tables: Sequence[str] = CACHED_TABLES) -> None:
+    """Invalidate cached tables as NOTIFY messages arrive from any worker.
+
+    Runs until cancelled, reconnecting with backoff. The whole cache is cleared
+    after every (re)connect because notifications sent while disconnected are lost.
+    """
+
+    delay = 1.0
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(get_dsn(), autocommit=True)
+            async with conn:
+                for table in tables:
+                    await conn.execute(f'LISTEN "{change_channel(table)}"')
+                response_cache.clear()
+                delay = 1.0
+                async for notify in conn.notifies():
+                    response_cache.invalidate(notify.channel[: -len(CHANGE_CHANNEL_SUFFIX)])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener failed; reconnecting in %.0fs", delay)
+            response_cache.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+__all__ = ["CACHED_TABLES", "ResponseCache", "cached_response", "listen_for_invalidations", "response_cache"]
@@ -1,66 +1,98 @@
 """Routes for managing Core Values (bullet points)."""
 
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-import psycopg
-
-from db import get_dsn
-from schemas import CoreValue
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json
+from schemas import BulkDelete, BulkResult, CoreValue, CoreValueCreate
 
 router = APIRouter(prefix="/core-values", tags=["core-values"])
 
+_LIST_QUERY = "SELECT id, bullet_text FROM core_values ORDER BY id"
+
 
 @router.get("", response_model=list[CoreValue])
-def list_core_values() -> list[CoreValue]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, bullet_text FROM core_values ORDER BY id")
-            rows = cur.fetchall()
+async def list_core_values(request: Request) -> Response:
+    return await cached_response(request, "core_values", "", _load_core_values)
+
+
+async def _load_core_values() -> Union[list[CoreValue], bytes]:
+    if FAST_JSON:
+        return await fetch_json(_LIST_QUERY)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_LIST_QUERY)
+            rows = await cur.fetchall()
     return [CoreValue(id=r[0], bullet_text=r[1]) for r in rows]
 
 
 @router.post("", response_model=CoreValue, status_code=201)
-def create_core_value(bullet_text: str = Form(...)) -> CoreValue:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def create_core_value(bullet_text: str = Form(...)) -> CoreValue:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO core_values (bullet_text) VALUES (%s) RETURNING id, bullet_text",
                 (bullet_text,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create core value")
+    response_cache.invalidate("core_values")
     return CoreValue(id=row[0], bullet_text=row[1])
 
 
 @router.put("/{cv_id}", response_model=CoreValue)
-def update_core_value(cv_id: int, bullet_text: Optional[str] = Form(None)) -> CoreValue:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT bullet_text FROM core_values WHERE id = %s", (cv_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Core value not found")
-            cur.execute(
-                "UPDATE core_values SET bullet_text = %s WHERE id = %s RETURNING id, bullet_text",
-                (bullet_text if bullet_text is not None else current[0], cv_id),
+@router.patch("/{cv_id}", response_model=CoreValue)
+async def update_core_value(cv_id: int, bullet_text: Optional[str] = Form(None)) -> CoreValue:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE core_values SET bullet_text = COALESCE(%s, bullet_text) WHERE id = %s RETURNING id, bullet_text",
+                (bullet_text, cv_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update core value")
+        raise HTTPException(status_code=404, detail="Core value not found")
+    response_cache.invalidate("core_values")
     return CoreValue(id=row[0], bullet_text=row[1])
 
 
 @router.delete("/{cv_id}", status_code=204)
-def delete_core_value(cv_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM core_values WHERE id = %s", (cv_id,))
+async def delete_core_value(cv_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM core_values WHERE id = %s", (cv_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Core value not found")
+    response_cache.invalidate("core_values")
     return None
 
 
+_BULK = BulkSpec(
+    "core_values",
+    CoreValueCreate,
+    "id, bullet_text",
+    lambda r: CoreValue(id=r[0], bullet_text=r[1]),
+)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201, openapi_extra=bulk_openapi(CoreValueCreate))
+async def bulk_create_core_values(request: Request) -> BulkResult:
+    return await bulk_insert(_BULK, await read_rows(request, CoreValueCreate))
+
+
+@router.post("/bulk/upsert", response_model=BulkResult, openapi_extra=bulk_openapi(_BULK.upsert_model))
+async def bulk_upsert_core_values(request: Request) -> BulkResult:
+    return await bulk_upsert(_BULK, await read_rows(request, _BULK.upsert_model))
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_core_values(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]
@@ -1,21 +1,30 @@
 """Database utilities for the Glowac API."""
 
 import os
+import time
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
 
 try:
     import psycopg
     from psycopg import sql
     from psycopg.conninfo import conninfo_to_dict, make_conninfo
+    from psycopg_pool import AsyncConnectionPool, ConnectionPool
 except ImportError as exc:  # pragma: no cover - dependency guidance
     raise SystemExit(
         "Required dependencies missing. Install with 'pip install -r requirements.txt' before rerunning."
     ) from exc
 
+from metrics import DB_ACQUIRE_SECONDS, observe_query
+from profiler import record_query
+from tracing import query_span, span
+
 _DATABASE_URL: Optional[str] = None
 _CONNINFO: Optional[Dict[str, str]] = None
 _DSN: Optional[str] = None
+_POOL: Optional[ConnectionPool] = None
+_ASYNC_POOL: Optional[AsyncConnectionPool] = None
 
 
 def _read_database_url_from_env_file() -> Optional[str]:
@@ -84,327 +93,216 @@ def ensure_database() -> None:
             cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(target_db)))
 
 
-def ensure_banner_table() -> None:
-    """Create the banner table if missing inside the target database."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS banner (
-                    id BIGSERIAL PRIMARY KEY,
-                    highlight_tag TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    image BYTEA,
-                    image_mime TEXT
-                )
-                """
-            )
-            cur.execute(
-                """
-                ALTER TABLE banner
-                ADD COLUMN IF NOT EXISTS image_mime TEXT
-                """
-            )
+# Content tables notify "<table>_changed" after every write statement so each
+# worker can drop its cached copies (see migrations/0003_change_notify.py and
+# cache.listen_for_invalidations).
+CHANGE_CHANNEL_SUFFIX = "_changed"
 
 
-__all__ = [
-    "ensure_database",
-    "ensure_banner_table",
-    "get_conninfo",
-    "get_dsn",
-]
+def change_channel(table: str) -> str:
+    """Return the NOTIFY channel announcing writes to *table*."""
+
+    return f"{table}{CHANGE_CHANNEL_SUFFIX}"
+
+
+def _finish_query(cur: Any, current: Any, query: Any, params: Any, started: float, batch: Optional[int] = None) -> None:
+    seconds = time.perf_counter() - started
+    observe_query(cur, seconds)
+    record_query(cur, query, params, seconds, batch)
+    if current is not None:
+        if cur.rowcount >= 0:
+            current.set_attribute("db.response.returned_rows", cur.rowcount)
+        if batch is not None:
+            current.set_attribute("db.operation.batch.size", batch)
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor timing each statement (metrics.py, profiler.py) and tracing it as a span (tracing.py)."""
+
+    def execute(self, query: Any, params: Any = None, **kwargs: Any) -> "InstrumentedCursor":
+        started = time.perf_counter()
+        with query_span(query, self) as current:
+            try:
+                return super().execute(query, params, **kwargs)
+            finally:
+                _finish_query(self, current, query, params, started)
+
+    def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        params_seq = list(params_seq)
+        started = time.perf_counter()
+        with query_span(query, self) as current:
+            try:
+                super().executemany(query, params_seq, **kwargs)
+            finally:
+                _finish_query(self, current, query, params_seq, started, len(params_seq))
+
+
+class InstrumentedAsyncCursor(psycopg.AsyncCursor):
+    """Async counterpart of ``InstrumentedCursor``, used by the request handlers' pool."""
 
-def ensure_tus_table() -> None:
-    """Create the tus table (opening hours entries) if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS tus (
-                    id BIGSERIAL PRIMARY KEY,
-                    day TEXT NOT NULL,
-                    hours TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'Open'
-                )
-                """
-            )
-
-__all__.append("ensure_tus_table")
-
-
-def ensure_facts_table() -> None:
-    """Create the facts table (homepage stats) if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS facts (
-                    id BIGSERIAL PRIMARY KEY,
-                    label TEXT NOT NULL,
-                    number BIGINT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'Visible'
-                )
-                """
-            )
-
-__all__.append("ensure_facts_table")
-
-
-def ensure_why_table() -> None:
-    """Create the why_choose_us table if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS why_choose_us (
-                    id BIGSERIAL PRIMARY KEY,
-                    label TEXT NOT NULL,
-                    value TEXT NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'Visible'
-                )
-                """
-            )
-
-__all__.append("ensure_why_table")
-
-
-def ensure_background_table() -> None:
-    """Create the background table (paragraph entries) if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS background (
-                    id BIGSERIAL PRIMARY KEY,
-                    paragraph TEXT NOT NULL
-                )
-                """
-            )
-
-__all__.append("ensure_background_table")
-
-
-def ensure_core_values_table() -> None:
-    """Create the core_values table (bullet points) if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS core_values (
-                    id BIGSERIAL PRIMARY KEY,
-                    bullet_text TEXT NOT NULL
-                )
-                """
-            )
-
-__all__.append("ensure_core_values_table")
-
-
-def ensure_gallery_table() -> None:
-    """Create the gallery table (image uploads) if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS gallery (
-                    id BIGSERIAL PRIMARY KEY,
-                    image BYTEA NOT NULL,
-                    image_mime TEXT
-                )
-                """
-            )
-
-__all__.append("ensure_gallery_table")
-
-
-def ensure_ceo_table() -> None:
-    """Create the ceo_card table for CEO Card entries if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS ceo_card (
-                    id BIGSERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    image_url TEXT,
-                    short_description TEXT
-                )
-                """
-            )
-            # ensure columns for storing uploaded image bytes and mime are present
-            cur.execute(
-                """
-                ALTER TABLE ceo_card
-                ADD COLUMN IF NOT EXISTS image BYTEA,
-                ADD COLUMN IF NOT EXISTS image_mime TEXT
-                """
-            )
-
-__all__.append("ensure_ceo_table")
-
-
-def ensure_members_table() -> None:
-    """Create the members table (team members) if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS members (
-                    id BIGSERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    image_url TEXT,
-                    short_description TEXT
-                )
-                """
-            )
-            # ensure columns for storing uploaded image bytes and mime are present
-            cur.execute(
-                """
-                ALTER TABLE members
-                ADD COLUMN IF NOT EXISTS image BYTEA,
-                ADD COLUMN IF NOT EXISTS image_mime TEXT
-                """
-            )
-
-__all__.append("ensure_members_table")
-
-
-def ensure_main_service_table() -> None:
-    """Create the main_service table if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS main_service (
-                    id BIGSERIAL PRIMARY KEY,
-                    service_name TEXT NOT NULL
-                )
-                """
-            )
-
-__all__.append("ensure_main_service_table")
-
-
-def ensure_sub_service_table() -> None:
-    """Create the sub_service table if missing.
-
-    Each sub_service references a main_service via main_service_id.
+    async def execute(self, query: Any, params: Any = None, **kwargs: Any) -> "InstrumentedAsyncCursor":
+        started = time.perf_counter()
+        with query_span(query, self) as current:
+            try:
+                return await super().execute(query, params, **kwargs)
+            finally:
+                _finish_query(self, current, query, params, started)
+
+    async def executemany(self, query: Any, params_seq: Any, **kwargs: Any) -> None:
+        params_seq = list(params_seq)
+        started = time.perf_counter()
+        with query_span(query, self) as current:
+            try:
+                await super().executemany(query, params_seq, **kwargs)
+            finally:
+                _finish_query(self, current, query, params_seq, started, len(params_seq))
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        "min_size": _env_int("DB_POOL_MIN_SIZE", 2),
+        "max_size": _env_int("DB_POOL_MAX_SIZE", 10),
+        "timeout": _env_float("DB_POOL_TIMEOUT", 30.0),
+        "max_idle": _env_float("DB_POOL_MAX_IDLE", 600.0),
+    }
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide blocking pool, opening it on first use.
+
+    Request handlers use the async pool; this one serves scripts and workers.
+    Sizing is controlled by DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+    (seconds to wait for a free connection) and DB_POOL_MAX_IDLE (seconds before
+    an idle connection above the minimum is closed).
     """
 
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS sub_service (
-                    id BIGSERIAL PRIMARY KEY,
-                    main_service_id BIGINT NOT NULL REFERENCES main_service(id) ON DELETE CASCADE,
-                    service_name TEXT NOT NULL,
-                    description TEXT
-                )
-                """
-            )
-            cur.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_sub_service_main_id ON sub_service(main_service_id)
-                """
-            )
-
-__all__.append("ensure_sub_service_table")
-
-
-def ensure_service_test_table() -> None:
-    """Create the service_test table if missing.
-
-    Fields: id, main_service_id (FK), sub_service_id (FK), test_name, description
+    global _POOL
+    if _POOL is None:
+        _POOL = ConnectionPool(
+            get_dsn(), name="glowac", open=True, kwargs={"cursor_factory": InstrumentedCursor}, **_pool_options()
+        )
+    return _POOL
+
+
+def open_pool() -> None:
+    """Open the connection pool; minimum connections are filled in the background."""
+
+    get_pool()
+
+
+def close_pool() -> None:
+    """Close the connection pool, if it was opened."""
+
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+        _POOL = None
+
+
+@contextmanager
+def connection() -> Iterator[psycopg.Connection]:
+    """Borrow a pooled connection for the duration of a block.
+
+    The transaction is committed when the block exits normally and rolled back
+    on error, matching ``with psycopg.connect(...)`` semantics.
     """
 
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS service_test (
-                    id BIGSERIAL PRIMARY KEY,
-                    main_service_id BIGINT NOT NULL REFERENCES main_service(id) ON DELETE CASCADE,
-                    sub_service_id BIGINT NOT NULL REFERENCES sub_service(id) ON DELETE CASCADE,
-                    test_name TEXT NOT NULL,
-                    description TEXT
-                )
-                """
-            )
-            cur.execute(
-                """
-                CREATE INDEX IF NOT EXISTS idx_service_test_sub_id ON service_test(sub_service_id)
-                """
-            )
-
-__all__.append("ensure_service_test_table")
-
-
-def ensure_messages_table() -> None:
-    """Create the messages table for contact form submissions if missing."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS messages (
-                    id BIGSERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-
-__all__.append("ensure_messages_table")
-
-
-def ensure_geotech_table() -> None:
-    """Create the geotech_requests table for geotechnical service requests."""
-
-    dsn = get_dsn()
-    with psycopg.connect(dsn, autocommit=True) as db_conn:
-        with db_conn.cursor() as cur:
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS geotech_requests (
-                    id BIGSERIAL PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    project_details TEXT NOT NULL,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                )
-                """
-            )
-
-__all__.append("ensure_geotech_table")
+    with ExitStack() as stack:
+        started = time.perf_counter()
+        with span("db.acquire", {"db.pool.name": "sync"}):
+            conn = stack.enter_context(get_pool().connection())
+        DB_ACQUIRE_SECONDS.labels("sync").observe(time.perf_counter() - started)
+        yield conn
+
+
+async def open_async_pool() -> AsyncConnectionPool:
+    """Open the async pool used by request handlers (same sizing variables)."""
+
+    global _ASYNC_POOL
+    if _ASYNC_POOL is None:
+        _ASYNC_POOL = AsyncConnectionPool(
+            get_dsn(), name="glowac-async", open=False, kwargs={"cursor_factory": InstrumentedAsyncCursor}, **_pool_options()
+        )
+    await _ASYNC_POOL.open()
+    return _ASYNC_POOL
+
+
+async def close_async_pool() -> None:
+    """Close the async pool, if it was opened."""
+
+    global _ASYNC_POOL
+    if _ASYNC_POOL is not None:
+        pool, _ASYNC_POOL = _ASYNC_POOL, None
+        await pool.close()
+
+
+@asynccontextmanager
+async def async_connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    """Borrow a connection from the async pool for the duration of a block."""
+
+    pool = _ASYNC_POOL if _ASYNC_POOL is not None else await open_async_pool()
+    async with AsyncExitStack() as stack:
+        started = time.perf_counter()
+        with span("db.acquire", {"db.pool.name": "async"}):
+            conn = await stack.enter_async_context(pool.connection())
+        DB_ACQUIRE_SECONDS.labels("async").observe(time.perf_counter() - started)
+        yield conn
+
+
+async def get_connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    """FastAPI dependency yielding a pooled async connection."""
+
+    async with async_connection() as conn:
+        yield conn
+
+
+def _stats(pool: Any) -> Dict[str, Any]:
+    if pool is None:
+        return {"open": False}
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    idle = stats.get("pool_available", 0)
+    return {
+        "open": True,
+        "min_size": stats.get("pool_min", pool.min_size),
+        "max_size": stats.get("pool_max", pool.max_size),
+        "in_use": size - idle,
+        "idle": idle,
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": stats.get("requests_num", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+    }
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Return usage counters (in use, idle, waiting, wait time) for both pools."""
+
+    return {"async": _stats(_ASYNC_POOL), "sync": _stats(_POOL)}
+
+
+__all__ = [
+    "async_connection",
+    "change_channel",
+    "close_async_pool",
+    "close_pool",
+    "connection",
+    "ensure_database",
+    "get_connection",
+    "get_conninfo",
+    "get_dsn",
+    "get_pool",
+    "open_async_pool",
+    "open_pool",
+    "pool_stats",
+]
@@ -0,0 +1,349 @@
+"""Resized and re-encoded variants of uploaded images.
+
+Image endpoints accept ``?w=<pixels>`` and ``?format=webp|avif|jpeg|png`` (or
+``format=original``). Widths are rounded up to the nearest of
+IMAGE_VARIANT_WIDTHS (default ``200,400,800,1600``) so only a handful of
+variants exist per image; when ``w`` is given without ``format``, the best
+pre-generated format (IMAGE_EAGER_FORMATS) listed in the request's ``Accept``
+header is picked (disable with IMAGE_NEGOTIATE_FORMAT=0). Requests without
+``w`` get the original, so negotiation never triggers a full-size re-encode.
+
+Variants are generated with Pillow in a process pool (IMAGE_WORKERS
+processes, default one per CPU) so encoding never blocks the event loop, are
+written to the blob store and recorded in the image_variants table keyed by
+the source image's SHA-256. Uploads queue an ``image_variants`` job (see
+jobs.py) that pre-generates the IMAGE_EAGER_FORMATS (default ``webp``)
+variants for every width; any other variant is generated the first time it is
+requested.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import IO, Dict, NamedTuple, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request
+from psycopg import sql
+
+from blobstore import BlobInfo, get_blob_store
+from db import async_connection
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+# Formats Pillow can decode reliably; anything else (SVG, animated GIF, ...) is only served as uploaded.
+RASTER_MIMES = {"image/jpeg", "image/png", "image/webp", "image/avif", "image/bmp", "image/tiff"}
+
+
+def _env_list(name: str, default: str) -> Tuple[str, ...]:
+    return tuple(item.strip() for item in (os.getenv(name) or default).split(",") if item.strip())
+
+
+WIDTHS = tuple(sorted(int(w) for w in _env_list("IMAGE_VARIANT_WIDTHS", "200,400,800,1600")))
+EAGER_FORMATS = tuple(f for f in _env_list("IMAGE_EAGER_FORMATS", "webp") if f in FORMATS)
+NEGOTIATE_FORMAT = (os.getenv("IMAGE_NEGOTIATE_FORMAT") or "1") not in ("0", "false", "no")
+QUALITY = int(os.getenv("IMAGE_QUALITY") or 80)
+# how long a variant whose source could not be decoded is not retried, and how many such variants are remembered
+FAILED_VARIANT_TTL = float(os.getenv("IMAGE_FAILED_VARIANT_TTL") or 3600)
+FAILED_VARIANT_MAX = 1024
+
+# Accept-negotiated formats in order of preference.
+_NEGOTIABLE = ("avif", "webp")
+
+
+class VariantSpec(NamedTuple):
+    """A requested variant; width 0 keeps the source width."""
+
+    width: int
+    format: str
+
+
+class Variant(NamedTuple):
+    key: str
+    size: int
+    sha256: str
+    mime: str
+
+
+def bucket_width(width: int) -> int:
+    """Round *width* up to the nearest configured width (the largest one at most)."""
+
+    for bucket in WIDTHS:
+        if width <= bucket:
+            return bucket
+    return WIDTHS[-1]
+
+
+def requested_variant(request: Request, mime: Optional[str]) -> Tuple[Optional[VariantSpec], bool]:
+    """Return the variant asked for by ``w`` / ``format`` / ``Accept`` and whether it depends on Accept.
+
+    Returns ``(None, ...)`` when the original should be served.
+    """
+
+    params = request.query_params
+    raw_width = params.get("w")
+    width = 0
+    if raw_width is not None:
+        # isdigit() alone also accepts non-ASCII digits such as "²"; very long strings would make int() raise
+        if not (raw_width.isascii() and raw_width.isdigit()) or len(raw_width) > 9 or int(raw_width) == 0:
+            raise HTTPException(status_code=400, detail="w must be a positive integer")
+        width = bucket_width(int(raw_width))
+    fmt = params.get("format")
+    if fmt is not None:
+        fmt = fmt.lower()
+        if fmt == "original":
+            return None, False
+        if fmt not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of: original, {', '.join(FORMATS)}")
+        return VariantSpec(width, fmt), False
+
+    if mime not in RASTER_MIMES or not width:
+        return None, False
+    negotiated = _negotiate(request.headers.get("accept", "")) if NEGOTIATE_FORMAT else None
+    if negotiated is not None and negotiated != FORMATS.get(mime):
+        fmt = negotiated
+    else:
+        # resize in the source format
+        fmt = next((name for name, value in FORMATS.items() if value == mime), "jpeg")
+    return VariantSpec(width, fmt), NEGOTIATE_FORMAT
+
+
+def _negotiate(accept: str) -> Optional[str]:
+    offered = set()
+    for item in accept.split(","):
+        media_type, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if quality > 0:
+            offered.add(media_type.strip().lower())
+    for fmt in _NEGOTIABLE:
+        # only formats the upload job pre-generates, so a negotiated variant is normally ready
+        if fmt in EAGER_FORMATS and FORMATS[fmt] in offered:
+            return fmt
+    return None
+
+
+class ImageDecodeError(Exception):
+    """The source image could not be decoded, or the variant could not be encoded."""
+
+
+def render_variant(source: Union[str, bytes], width: int, fmt: str, quality: int) -> BlobInfo:
+    """Decode *source* (a blob key or raw bytes), resize and re-encode it into the blob store.
+
+    Runs in a worker process, either the server's image pool or a job worker.
+    Pillow errors are raised as ``ImageDecodeError``; blob store errors as they are.
+    """
+
+    # imported here so only worker processes pay for Pillow
+    from PIL import Image
+
+    store = get_blob_store()
+    stream = io.BytesIO(source) if isinstance(source, bytes) else store.open(source)
+    with stream, tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as out:
+        try:
+            _encode_variant(stream, out, width, fmt, quality)
+        except (ConnectionError, TimeoutError, FileNotFoundError, PermissionError):
+            # reading the source failed, not decoding it
+            raise
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+            raise ImageDecodeError(f"{type(exc).__name__}: {exc}") from None
+        out.seek(0)
+        return store.put_file(out)
+
+
+def _encode_variant(stream: IO[bytes], out: IO[bytes], width: int, fmt: str, quality: int) -> None:
+    from PIL import ExifTags, Image, ImageOps
+
+    with Image.open(stream) as img:
+        if width:
+            # EXIF orientations 5-8 rotate by 90 degrees, so the output width is the stored height
+            rotated = img.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8)
+            shown_width, shown_height = (img.height, img.width) if rotated else img.size
+            if shown_width > width:
+                # let the JPEG decoder downscale by a power of two while decoding
+                height = round(shown_height * width / shown_width)
+                img.draft("RGB", (height, width) if rotated else (width, height))
+        img = ImageOps.exif_transpose(img)
+        if width and img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+        img.save(out, format=fmt.upper(), quality=quality)
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        workers = int(os.getenv("IMAGE_WORKERS") or 0) or None
+        # spawn rather than fork: the server process has threads and open connections
+        _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _POOL
+
+
+def shutdown_image_workers() -> None:
+    """Stop the process pool used to generate variants."""
+
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+
+async def render_in_pool(source: Union[str, bytes], width: int, fmt: str) -> BlobInfo:
+    """Run ``render_variant`` in the image process pool."""
+
+    global _POOL
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), render_variant, source, width, fmt, QUALITY)
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for memory); start a fresh pool next time
+        _POOL = None
+        raise
+
+
+async def _lookup(source_sha256: str, spec: VariantSpec) -> Optional[Variant]:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT blob_key, size, sha256, mime
+                FROM image_variants
+                WHERE source_sha256 = %s AND width = %s AND format = %s
+                """,
+                (source_sha256, spec.width, spec.format),
+            )
+            row = await cur.fetchone()
+    return Variant(*row) if row is not None else None
+
+
+async def _generate(
+    source_sha256: str, spec: VariantSpec, key: Optional[str], table: Optional[str], row_id: Optional[int]
+) -> Optional[Variant]:
+    source: Union[str, bytes, None] = key
+    if source is None:
+        # legacy BYTEA image not moved to the blob store yet
+        async with async_connection() as conn:
+            cur = await conn.execute(
+                sql.SQL("SELECT image FROM {} WHERE id = %s AND image_sha256 = %s").format(sql.Identifier(table)),
+                (row_id, source_sha256),
+            )
+            row = await cur.fetchone()
+        if row is None or row[0] is None:
+            return None
+        source = bytes(row[0])
+    info = await render_in_pool(source, spec.width, spec.format)
+    variant = Variant(key=info.key, size=info.size, sha256=info.sha256, mime=FORMATS[spec.format])
+    async with async_connection() as conn:
+        await conn.execute(
+            """
+            INSERT INTO image_variants (source_sha256, width, format, blob_key, size, sha256, mime)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (source_sha256, width, format) DO NOTHING
+            """,
+            (source_sha256, spec.width, spec.format, *variant),
+        )
+    return variant
+
+
+_inflight: Dict[Tuple[str, VariantSpec], "asyncio.Task[Optional[Variant]]"] = {}
+_failed: "OrderedDict[Tuple[str, VariantSpec], float]" = OrderedDict()
+
+
+def _recently_failed(ident: Tuple[str, VariantSpec]) -> bool:
+    expires_at = _failed.get(ident)
+    if expires_at is None:
+        return False
+    if expires_at <= time.monotonic():
+        del _failed[ident]
+        return False
+    return True
+
+
+def _remember_failure(ident: Tuple[str, VariantSpec]) -> None:
+    _failed[ident] = time.monotonic() + FAILED_VARIANT_TTL
+    _failed.move_to_end(ident)
+    while len(_failed) > FAILED_VARIANT_MAX:
+        _failed.popitem(last=False)
+
+
+async def ensure_variant(
+    spec: VariantSpec,
+    source_sha256: str,
+    *,
+    key: Optional[str] = None,
+    table: Optional[str] = None,
+    row_id: Optional[int] = None,
+) -> Optional[Variant]:
+    """Return the stored variant, generating it first if needed.
+
+    The source is the blob *key*, or the BYTEA ``image`` column of *table* row
+    *row_id* when the image has no key yet. Concurrent requests for the same
+    variant share one generation. Returns None, and the caller serves the
+    original, when the variant cannot be generated; sources that cannot be
+    decoded are not retried for FAILED_VARIANT_TTL seconds.
+    """
+
+    found = await _lookup(source_sha256, spec)
+    if found is not None:
+        return found
+    ident = (source_sha256, spec)
+    if _recently_failed(ident):
+        return None
+    task = _inflight.get(ident)
+    if task is None:
+        task = asyncio.ensure_future(_generate(source_sha256, spec, key, table, row_id))
+        _inflight[ident] = task
+        task.add_done_callback(lambda _: _inflight.pop(ident, None))
+    try:
+        return await asyncio.shield(task)
+    except ImageDecodeError as exc:
+        logger.warning("Could not generate %s variant of image %s: %s", spec, source_sha256, exc)
+        _remember_failure(ident)
+        return None
+    except Exception:
+        # pool timeouts, blob store or worker failures: serve the original, retry next time
+        logger.warning("Could not generate %s variant of image %s", spec, source_sha256, exc_info=True)
+        return None
+
+
+__all__ = [
+    "EAGER_FORMATS",
+    "FORMATS",
+    "ImageDecodeError",
+    "QUALITY",
+    "RASTER_MIMES",
+    "WIDTHS",
+    "Variant",
+    "VariantSpec",
+    "bucket_width",
+    "ensure_variant",
+    "render_in_pool",
+    "render_variant",
+    "requested_variant",
+    "shutdown_image_workers",
+]
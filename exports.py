@@ -0,0 +1,141 @@
+"""Streaming NDJSON / CSV exports of the append-only tables (messages, geotech requests).
+
+Rows are read through a named server-side cursor, EXPORT_BATCH_SIZE at a time
+(default 1000), and each batch is written to the response as it arrives, so
+memory use does not grow with the table. ``since`` / ``until`` select a
+half-open ``created_at`` range, served by the ``(created_at, id)`` index of
+each table; ``gzip=true`` compresses the stream (served as a ``.gz`` file).
+
+Each running export holds a pooled connection for as long as the download
+lasts, so at most EXPORT_MAX_CONCURRENT (default 2) run at once; further
+requests get a 503 with ``Retry-After`` instead of draining the pool.
+"""
+
+import asyncio
+import csv
+import io
+import os
+import zlib
+from datetime import date, datetime
+from typing import Annotated, Any, AsyncIterator, Dict, List, Literal, Optional, Sequence, Union
+
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+from psycopg import sql
+from psycopg.rows import dict_row
+
+from db import async_connection
+from fast_json import dumps
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE") or 1000)
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT") or 2)
+
+ExportFormat = Annotated[Literal["ndjson", "csv"], Query(description="One JSON object per line, or CSV with a header")]
+Since = Annotated[Optional[datetime], Query(description="Only rows created at or after this time")]
+Until = Annotated[Optional[datetime], Query(description="Only rows created before this time")]
+Gzip = Annotated[bool, Query(description="Compress the export with gzip")]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+EXPORT_RESPONSES: Dict[Union[int, str], Dict[str, Any]] = {
+    200: {
+        "description": "The matching rows, oldest first, streamed as NDJSON or CSV (gzipped with gzip=true).",
+        "content": {"application/x-ndjson": {}, "text/csv": {}, "application/gzip": {}},
+    },
+    503: {"description": f"{EXPORT_MAX_CONCURRENT} exports are already running; retry later"},
+}
+
+_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENT)
+
+
+def export_query(
+    table: str, columns: Sequence[str], since: Optional[datetime], until: Optional[datetime]
+) -> sql.Composed:
+    # conditions are only added when given, so every variant plans as a plain index range scan
+    conditions = []
+    if since is not None:
+        conditions.append(sql.SQL("created_at >= %(since)s"))
+    if until is not None:
+        conditions.append(sql.SQL("created_at < %(until)s"))
+    where = sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    return sql.SQL("SELECT {columns} FROM {table}{where} ORDER BY created_at, id").format(
+        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+        table=sql.Identifier(table),
+        where=where,
+    )
+
+
+async def _batches(query: sql.Composed, params: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+    # the slot is taken before the connection and released with it, when the stream ends or is dropped
+    async with _slots, async_connection() as conn:
+        async with conn.cursor(name="export", row_factory=dict_row) as cur:
+            await cur.execute(query, params)
+            while rows := await cur.fetchmany(EXPORT_BATCH_SIZE):
+                yield rows
+
+
+def _csv_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_chunk(rows: Sequence[Sequence[Any]]) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return out.getvalue().encode()
+
+
+async def _encode(
+    batches: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[str], fmt: str, compress: bool
+) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    if fmt == "csv":
+        header = _csv_chunk([columns])
+        yield compressor.compress(header) if compressor else header
+    async for rows in batches:
+        if fmt == "csv":
+            chunk = _csv_chunk([row.values() for row in rows])
+        else:
+            chunk = b"".join(dumps(row) + b"\n" for row in rows)
+        if compressor is None:
+            yield chunk
+        elif compressed := compressor.compress(chunk):
+            yield compressed
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def export_response(
+    table: str,
+    columns: Sequence[str],
+    fmt: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    compress: bool,
+) -> StreamingResponse:
+    """Stream the rows of *table* created in [*since*, *until*) as an NDJSON or CSV attachment."""
+
+    # an export that passes this check just as another starts waits in _batches for a slot
+    if _slots.locked():
+        raise HTTPException(
+            status_code=503, detail="Too many exports running, try again later", headers={"Retry-After": "30"}
+        )
+    query = export_query(table, columns, since, until)
+    filename = f"{table}-{date.today():%Y%m%d}.{fmt}" + (".gz" if compress else "")
+    return StreamingResponse(
+        _encode(_batches(query, {"since": since, "until": until}), columns, fmt, compress),
+        media_type="application/gzip" if compress else MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+__all__ = [
+    "EXPORT_BATCH_SIZE",
+    "EXPORT_MAX_CONCURRENT",
+    "EXPORT_RESPONSES",
+    "ExportFormat",
+    "Gzip",
+    "Since",
+    "Until",
+    "export_query",
+    "export_response",
+]
@@ -1,83 +1,109 @@
 """Routes for managing Facts & Figures (homepage stats)."""
 
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-import psycopg
-
-from db import get_dsn
-from schemas import Fact
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json
+from schemas import BulkDelete, BulkResult, Fact, FactCreate
 
 router = APIRouter(prefix="/facts", tags=["facts"])
 
 
 @router.get("", response_model=list[Fact])
-def list_facts() -> list[Fact]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, label, number, status FROM facts ORDER BY id")
-            rows = cur.fetchall()
+async def list_facts(request: Request) -> Response:
+    return await cached_response(request, "facts", "", _load_facts)
+
+
+async def _load_facts() -> Union[list[Fact], bytes]:
+    if FAST_JSON:
+        # number is a string in the API
+        return await fetch_json("SELECT id, label, number::text AS number, status FROM facts ORDER BY id")
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, label, number, status FROM facts ORDER BY id")
+            rows = await cur.fetchall()
     return [Fact(id=r[0], label=r[1], number=str(r[2]) if r[2] is not None else "", status=r[3]) for r in rows]
 
 
 @router.post("", response_model=Fact, status_code=201)
-def create_fact(label: str = Form(...), number: str = Form(...), status: str = Form("Visible")) -> Fact:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def create_fact(label: str = Form(...), number: str = Form(...), status: str = Form("Visible")) -> Fact:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO facts (label, number, status) VALUES (%s, %s, %s) RETURNING id, label, number, status",
                 (label, number, status),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create fact")
+    response_cache.invalidate("facts")
     return Fact(id=row[0], label=row[1], number=str(row[2]) if row[2] is not None else "", status=row[3])
 
 
 @router.put("/{fact_id}", response_model=Fact)
-def update_fact(
+@router.patch("/{fact_id}", response_model=Fact)
+async def update_fact(
     fact_id: int,
     label: Optional[str] = Form(None),
     number: Optional[str] = Form(None),
     status: Optional[str] = Form(None),
 ) -> Fact:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT label, number, status FROM facts WHERE id = %s", (fact_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Fact not found")
-            cur.execute(
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE facts
-                SET label = %s,
-                    number = %s,
-                    status = %s
+                SET label = COALESCE(%s, label),
+                    number = COALESCE(%s, number),
+                    status = COALESCE(%s, status)
                 WHERE id = %s
                 RETURNING id, label, number, status
                 """,
-                (
-                    label if label is not None else current[0],
-                    number if number is not None else current[1],
-                    status if status is not None else current[2],
-                    fact_id,
-                ),
+                (label, number, status, fact_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update fact")
+        raise HTTPException(status_code=404, detail="Fact not found")
+    response_cache.invalidate("facts")
     return Fact(id=row[0], label=row[1], number=str(row[2]) if row[2] is not None else "", status=row[3])
 
 
 @router.delete("/{fact_id}", status_code=204)
-def delete_fact(fact_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM facts WHERE id = %s", (fact_id,))
+async def delete_fact(fact_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM facts WHERE id = %s", (fact_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Fact not found")
+    response_cache.invalidate("facts")
     return None
 
 
+_BULK = BulkSpec(
+    "facts",
+    FactCreate,
+    "id, label, number, status",
+    lambda r: Fact(id=r[0], label=r[1], number=str(r[2]) if r[2] is not None else "", status=r[3]),
+)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201, openapi_extra=bulk_openapi(FactCreate))
+async def bulk_create_facts(request: Request) -> BulkResult:
+    return await bulk_insert(_BULK, await read_rows(request, FactCreate))
+
+
+@router.post("/bulk/upsert", response_model=BulkResult, openapi_extra=bulk_openapi(_BULK.upsert_model))
+async def bulk_upsert_facts(request: Request) -> BulkResult:
+    return await bulk_upsert(_BULK, await read_rows(request, _BULK.upsert_model))
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_facts(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]
@@ -0,0 +1,56 @@
+"""Opt-in fast path for large JSON lists.
+
+With FAST_JSON=1 the plain list endpoints fetch rows as dicts (psycopg's
+``dict_row``) and encode them in one call, instead of building a model from
+schemas.py for every row first. Their queries select exactly the model's
+fields under the model's names, so the body is unchanged, and the models
+still document the endpoints through ``response_model``. Encoding uses
+orjson when it is installed (``pip install orjson``), else pydantic-core.
+"""
+
+import os
+from typing import Any
+
+from psycopg.rows import dict_row
+from pydantic_core import to_json
+
+from db import async_connection
+from pagination import Page, paginate
+
+FAST_JSON = (os.getenv("FAST_JSON") or "0") not in ("0", "false", "no")
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Encode *value* as JSON the way the response models would (datetimes in UTC end in ``Z``)."""
+
+    if orjson is None:
+        return to_json(value)
+    return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+
+
+async def fetch_json(query: str, params: Any = None) -> bytes:
+    """Run *query* and return its rows as a JSON array of objects keyed by column name."""
+
+    async with async_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+    return dumps(rows)
+
+
+async def fetch_json_page(query: str, params: Any, limit: int) -> Page:
+    """Like ``fetch_json`` for a query selecting ``LIMIT limit + 1`` rows ordered by id."""
+
+    async with async_connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(query, params)
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: str(r["id"]))
+    return Page(dumps(rows), next_cursor)
+
+
+__all__ = ["FAST_JSON", "dumps", "fetch_json", "fetch_json_page"]
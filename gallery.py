@@ -3,73 +3,78 @@
 from typing import Optional
 
 from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile
-from fastapi.responses import StreamingResponse
 
-import psycopg
-
-from db import get_dsn
+from cache import cached_response, response_cache
+from db import async_connection
+from images import enqueue_image_jobs, serve_image, store_upload
+from pagination import DEFAULT_PAGE_SIZE, Cursor, Page, PageSize, id_cursor, paginate
 from schemas import Gallery
 
 router = APIRouter(prefix="/gallery", tags=["gallery"])
 
 
 @router.get("", response_model=list[Gallery])
-def list_gallery(request: Request) -> list[Gallery]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, image FROM gallery ORDER BY id")
-            rows = cur.fetchall()
+async def list_gallery(request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None) -> Response:
+    after_id = id_cursor(after)
+    return await cached_response(
+        request, "gallery", str(request.base_url), lambda: _load_gallery(request, limit, after_id)
+    )
+
+
+async def _load_gallery(request: Request, limit: int, after_id: int) -> Page:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id FROM gallery WHERE id > %s ORDER BY id LIMIT %s", (after_id, limit + 1))
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: str(r[0]))
     results = []
     for r in rows:
         id_ = r[0]
         preview_url = str(request.url_for("get_gallery_image", gallery_id=id_))
         results.append(Gallery(id=id_, image_preview_url=preview_url))
-    return results
+    return Page(results, next_cursor)
 
 
 @router.post("", response_model=Gallery, status_code=201)
-def upload_image(request: Request, image: UploadFile = File(...)) -> Gallery:
-    file_contents = image.file.read()
-    image.file.close()
-    if not file_contents:
+async def upload_image(request: Request, image: UploadFile = File(...)) -> Gallery:
+    stored = await store_upload(image)
+    if stored is None:
         raise HTTPException(status_code=400, detail="Uploaded image file is empty")
-    image_mime = image.content_type or "application/octet-stream"
 
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO gallery (image, image_mime) VALUES (%s, %s) RETURNING id, image, image_mime",
-                (psycopg.Binary(file_contents), image_mime),
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                INSERT INTO gallery (image_key, image_mime, image_size, image_sha256, image_updated_at)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+                """,
+                (stored.key, stored.mime, stored.size, stored.sha256, stored.updated_at),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
+            if row is not None:
+                await enqueue_image_jobs(conn, stored)
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to store image")
     id_ = row[0]
     preview_url = str(request.url_for("get_gallery_image", gallery_id=id_))
+    response_cache.invalidate("gallery")
     return Gallery(id=id_, image_preview_url=preview_url)
 
 
 @router.delete("/{gallery_id}", status_code=204)
-def delete_image(gallery_id: int) -> Response:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM gallery WHERE id = %s", (gallery_id,))
+async def delete_image(gallery_id: int) -> Response:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM gallery WHERE id = %s", (gallery_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Image not found")
+    response_cache.invalidate("gallery")
     return Response(status_code=204)
 
 
 @router.get("/{gallery_id}/image", name="get_gallery_image")
-def get_gallery_image(gallery_id: int) -> StreamingResponse:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT image, image_mime FROM gallery WHERE id = %s", (gallery_id,))
-            row = cur.fetchone()
-    if row is None or row[0] is None:
-        raise HTTPException(status_code=404, detail="Image not found")
-    media_type = row[1] or "application/octet-stream"
-    headers = {"Content-Disposition": "inline"}
-    return StreamingResponse(iter([bytes(row[0])]), media_type=media_type, headers=headers)
+async def get_gallery_image(gallery_id: int, request: Request) -> Response:
+    return await serve_image(request, "gallery", gallery_id, "Image not found")
 
 
 __all__ = ["router"]
@@ -1,43 +1,91 @@
-"""Routes for Requesting Geotechnical Services (create + list)."""
+"""Routes for Requesting Geotechnical Services (public create; list and export need the admin token)."""
 
 from typing import Optional
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 
-import psycopg
-
-from db import get_dsn
+from admin import require_admin
+from db import async_connection
+from exports import EXPORT_RESPONSES, ExportFormat, Gzip, Since, Until, export_response
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    Cursor,
+    Page,
+    PageSize,
+    encode_time_cursor,
+    page_response,
+    paginate,
+    time_cursor,
+)
 from schemas import GeotechRequest
 
+GEOTECH_COLUMNS = ("id", "name", "email", "phone", "project_details", "created_at")
+
 router = APIRouter(prefix="/geotech-requests", tags=["geotech"])
 
 
 @router.post("", response_model=GeotechRequest, status_code=201)
-def create_geotech_request(
+async def create_geotech_request(
     name: str = Form(...),
     email: str = Form(...),
     phone: str = Form(...),
     project_details: str = Form(...),
 ) -> GeotechRequest:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO geotech_requests (name, email, phone, project_details) VALUES (%s, %s, %s, %s) RETURNING id, name, email, phone, project_details, created_at",
                 (name, email, phone, project_details),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to save request")
     return GeotechRequest(id=row[0], name=row[1], email=row[2], phone=row[3], project_details=row[4], created_at=row[5])
 
 
-@router.get("", response_model=list[GeotechRequest])
-def list_geotech_requests() -> list[GeotechRequest]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, name, email, phone, project_details, created_at FROM geotech_requests ORDER BY created_at DESC")
-            rows = cur.fetchall()
-    return [GeotechRequest(id=r[0], name=r[1], email=r[2], phone=r[3], project_details=r[4], created_at=r[5]) for r in rows]
+@router.get("", response_model=list[GeotechRequest], dependencies=[Depends(require_admin)])
+async def list_geotech_requests(
+    request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None
+) -> Response:
+    cursor = time_cursor(after)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            # two statements rather than "%s IS NULL OR ...", so both plan as a plain index range scan
+            if cursor is None:
+                await cur.execute(
+                    "SELECT id, name, email, phone, project_details, created_at FROM geotech_requests ORDER BY created_at DESC, id DESC LIMIT %s",
+                    (limit + 1,),
+                )
+            else:
+                await cur.execute(
+                    """
+                    SELECT id, name, email, phone, project_details, created_at
+                    FROM geotech_requests
+                    WHERE (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (*cursor, limit + 1),
+                )
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: encode_time_cursor(r[5], r[0]))
+    items = [
+        GeotechRequest(id=r[0], name=r[1], email=r[2], phone=r[3], project_details=r[4], created_at=r[5])
+        for r in rows
+    ]
+    return page_response(request, Page(items, next_cursor))
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses=EXPORT_RESPONSES,
+    dependencies=[Depends(require_admin)],
+)
+async def export_geotech_requests(
+    format: ExportFormat = "ndjson", since: Since = None, until: Until = None, gzip: Gzip = False
+) -> StreamingResponse:
+    return export_response("geotech_requests", GEOTECH_COLUMNS, format, since, until, gzip)
 
 
 __all__ = ["router"]
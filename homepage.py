@@ -0,0 +1,152 @@
+"""Aggregated homepage endpoint: every section the landing page needs in one response.
+
+``GET /homepage?sections=banners,facts`` returns an object keyed by section
+(all sections when ``sections`` is omitted). The section queries are sent
+together in a single pipeline on one pooled connection, so the whole page
+costs one database round trip, and the response is cached as one unit that is
+invalidated by a write to any of the tables behind it. The paginated sections
+(banners, members, gallery) contain their first DEFAULT_PAGE_SIZE items.
+"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from banner import _BANNER_COLUMNS, _row_to_banner
+from cache import cached_response, response_cache
+from db import async_connection
+from pagination import DEFAULT_PAGE_SIZE
+from schemas import CEO, Background, CoreValue, Fact, Gallery, Homepage, MainService, Member, Tus, Why
+
+router = APIRouter(tags=["homepage"])
+
+
+class Section(NamedTuple):
+    table: str
+    query: str
+    build: Callable[[Sequence[tuple], Request], List[Any]]
+
+
+def _people(model: Any, route: str, param: str) -> Callable[[Sequence[tuple], Request], List[Any]]:
+    def build(rows: Sequence[tuple], request: Request) -> List[Any]:
+        return [
+            model(
+                id=r[0],
+                name=r[1],
+                title=r[2],
+                email=r[3],
+                image_url=str(request.url_for(route, **{param: r[0]})),
+                image_mime=r[4],
+                short_description=r[5],
+            )
+            for r in rows
+        ]
+
+    return build
+
+
+SECTIONS: Dict[str, Section] = {
+    "banners": Section(
+        "banner",
+        f"SELECT {_BANNER_COLUMNS} FROM banner ORDER BY id LIMIT {DEFAULT_PAGE_SIZE}",
+        lambda rows, request: [_row_to_banner(r, request) for r in rows],
+    ),
+    "tus": Section(
+        "tus",
+        "SELECT id, day, hours, status FROM tus ORDER BY id",
+        lambda rows, request: [Tus(id=r[0], day=r[1], hours=r[2], status=r[3]) for r in rows],
+    ),
+    "facts": Section(
+        "facts",
+        "SELECT id, label, number, status FROM facts ORDER BY id",
+        lambda rows, request: [
+            Fact(id=r[0], label=r[1], number=str(r[2]) if r[2] is not None else "", status=r[3]) for r in rows
+        ],
+    ),
+    "why": Section(
+        "why_choose_us",
+        "SELECT id, label, value, status FROM why_choose_us ORDER BY id",
+        lambda rows, request: [Why(id=r[0], label=r[1], value=r[2], status=r[3]) for r in rows],
+    ),
+    "background": Section(
+        "background",
+        "SELECT id, paragraph FROM background ORDER BY id",
+        lambda rows, request: [Background(id=r[0], paragraph=r[1]) for r in rows],
+    ),
+    "core_values": Section(
+        "core_values",
+        "SELECT id, bullet_text FROM core_values ORDER BY id",
+        lambda rows, request: [CoreValue(id=r[0], bullet_text=r[1]) for r in rows],
+    ),
+    "ceo": Section(
+        "ceo_card",
+        "SELECT id, name, title, email, image_mime, short_description FROM ceo_card ORDER BY id",
+        _people(CEO, "get_ceo_image", "ceo_id"),
+    ),
+    "members": Section(
+        "members",
+        "SELECT id, name, title, email, image_mime, short_description"
+        f" FROM members ORDER BY id LIMIT {DEFAULT_PAGE_SIZE}",
+        _people(Member, "get_member_image", "member_id"),
+    ),
+    "main_services": Section(
+        "main_service",
+        "SELECT id, service_name FROM main_service ORDER BY id",
+        lambda rows, request: [MainService(id=r[0], service_name=r[1]) for r in rows],
+    ),
+    "gallery": Section(
+        "gallery",
+        f"SELECT id FROM gallery ORDER BY id LIMIT {DEFAULT_PAGE_SIZE}",
+        lambda rows, request: [
+            Gallery(id=r[0], image_preview_url=str(request.url_for("get_gallery_image", gallery_id=r[0])))
+            for r in rows
+        ],
+    ),
+}
+
+response_cache.depends_on("homepage", {section.table for section in SECTIONS.values()})
+
+
+def _requested_sections(sections: Optional[str]) -> List[str]:
+    if not sections:
+        return list(SECTIONS)
+    names = [name.strip() for name in sections.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SECTIONS]
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown sections: {', '.join(unknown)}; expected any of {', '.join(SECTIONS)}"
+        )
+    # sections always come back in SECTIONS order, whatever order they were asked for in
+    return [name for name in SECTIONS if name in names]
+
+
+# the model only documents the body: cached_response encodes the dict built by
+# _load_homepage, which has a key for each requested section and no others
+@router.get("/homepage", response_model=Homepage)
+async def get_homepage(
+    request: Request,
+    sections: Optional[str] = Query(None, description="Comma-separated sections to include (default: all)"),
+) -> Response:
+    names = _requested_sections(sections)
+    return await cached_response(
+        request, "homepage", f"{request.base_url}|{','.join(names)}", lambda: _load_homepage(request, names)
+    )
+
+
+async def _load_homepage(request: Request, names: List[str]) -> Dict[str, List[Any]]:
+    async with async_connection() as conn:
+        cursors = []
+        # queue every query, then read all results after a single sync
+        async with conn.pipeline():
+            for name in names:
+                cur = conn.cursor()
+                await cur.execute(SECTIONS[name].query)
+                cursors.append(cur)
+        results = {}
+        for name, cur in zip(names, cursors):
+            async with cur:
+                results[name] = SECTIONS[name].build(await cur.fetchall(), request)
+    return results
+
+
+__all__ = ["SECTIONS", "router"]
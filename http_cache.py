@@ -0,0 +1,149 @@
+"""HTTP validators (ETag / Last-Modified), byte ranges and Cache-Control settings.
+
+LIST_CACHE_CONTROL and IMAGE_CACHE_CONTROL override the Cache-Control header
+sent with list and image responses respectively.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+LIST_CACHE_CONTROL = os.getenv("LIST_CACHE_CONTROL") or "no-cache"
+IMAGE_CACHE_CONTROL = os.getenv("IMAGE_CACHE_CONTROL") or "public, max-age=86400"
+
+# Requests asking for more ranges than this get the full representation instead.
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested byte ranges overlap the representation."""
+
+
+def make_etag(body: bytes) -> str:
+    """Return a strong ETag derived from the response body."""
+
+    return f'"{hashlib.sha256(body).hexdigest()}"'
+
+
+def quote_etag(tag: str) -> str:
+    return f'"{tag}"'
+
+
+def if_none_match_tags(request: Request) -> Optional[List[str]]:
+    """Return the unquoted entity tags listed in If-None-Match, or None if absent.
+
+    ``*`` is returned as-is; weak tags are compared like strong ones, as
+    RFC 9110 requires for If-None-Match.
+    """
+
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    tags = []
+    for raw in header.split(","):
+        tag = raw.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return [tag for tag in tags if tag]
+
+
+def if_modified_since(request: Request) -> Optional[datetime]:
+    """Return If-Modified-Since, ignored when If-None-Match is present."""
+
+    header = request.headers.get("if-modified-since")
+    if header is None or "if-none-match" in request.headers:
+        return None
+    try:
+        value = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return None
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    tags = if_none_match_tags(request)
+    return tags is not None and ("*" in tags or etag.strip('"') in tags)
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def if_range_allows(request: Request, etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """Return False when If-Range names a different version than the current one."""
+
+    header = request.headers.get("if-range")
+    if header is None:
+        return True
+    header = header.strip()
+    if header.startswith('"'):
+        return etag is not None and header == etag
+    if last_modified is None:
+        return False
+    return header == http_date(last_modified)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a ``Range: bytes=...`` header into half-open ``(start, end)`` spans.
+
+    Returns None when the header is absent, malformed or asks for too many
+    ranges (the caller then serves the whole body) and raises
+    RangeNotSatisfiable when no range overlaps *size* bytes.
+    """
+
+    if header is None:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+    spans: List[Tuple[int, int]] = []
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        # isdigit() alone also accepts non-ASCII digits such as "²" or "١"
+        if not dash or not (first or last) or not ((first + last).isascii() and (first + last).isdigit()):
+            return None
+        if not first:
+            length = int(last)
+            if length == 0:
+                continue
+            spans.append((max(size - length, 0), size))
+            continue
+        start = int(first)
+        end = int(last) + 1 if last else size
+        if last and end <= start:
+            return None
+        if start >= size:
+            continue
+        spans.append((start, min(end, size)))
+    if not spans:
+        raise RangeNotSatisfiable()
+    return spans
+
+
+__all__ = [
+    "IMAGE_CACHE_CONTROL",
+    "LIST_CACHE_CONTROL",
+    "MAX_RANGES",
+    "RangeNotSatisfiable",
+    "etag_matches",
+    "http_date",
+    "if_modified_since",
+    "if_none_match_tags",
+    "if_range_allows",
+    "make_etag",
+    "not_modified",
+    "parse_range",
+    "quote_etag",
+]
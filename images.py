@@ -0,0 +1,255 @@
+"""Shared upload and serving logic for the banner, CEO, member and gallery images."""
+
+import secrets
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from psycopg import AsyncConnection, sql
+
+from blobstore import BlobTooLarge, get_blob_store
+from db import async_connection
+from jobs import enqueue
+from metrics import mark_image
+from derivatives import EAGER_FORMATS, RASTER_MIMES, WIDTHS, ensure_variant, requested_variant
+from http_cache import (
+    IMAGE_CACHE_CONTROL,
+    RangeNotSatisfiable,
+    http_date,
+    if_modified_since,
+    if_none_match_tags,
+    if_range_allows,
+    not_modified,
+    parse_range,
+    quote_etag,
+)
+from uploads import MAX_UPLOAD_BYTES
+
+
+class StoredImage(NamedTuple):
+    """Column values recorded for an image written to the blob store."""
+
+    key: str
+    mime: str
+    size: int
+    sha256: str
+    updated_at: datetime
+
+
+async def store_upload(image: UploadFile) -> Optional[StoredImage]:
+    """Write an uploaded file to the blob store; return None when it is empty.
+
+    The upload is copied and hashed in chunks; anything over MAX_UPLOAD_BYTES
+    is discarded with a 413.
+    """
+
+    try:
+        info = await run_in_threadpool(get_blob_store().put_file, image.file, MAX_UPLOAD_BYTES)
+    except BlobTooLarge:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    finally:
+        await image.close()
+    if info.size == 0:
+        return None
+    return StoredImage(
+        key=info.key,
+        mime=image.content_type or "application/octet-stream",
+        size=info.size,
+        sha256=info.sha256,
+        updated_at=datetime.now(timezone.utc),
+    )
+
+
+async def enqueue_image_jobs(conn: AsyncConnection, stored: Optional[StoredImage]) -> None:
+    """Queue metadata extraction and eager variants for a newly stored image.
+
+    Call it on the connection that writes the image row, so the jobs only run
+    once that row is committed.
+    """
+
+    if stored is None or stored.mime not in RASTER_MIMES:
+        return
+    payload = {"key": stored.key, "sha256": stored.sha256}
+    await enqueue(conn, "image_metadata", payload)
+    cur = await conn.execute(
+        "SELECT count(*) FROM image_variants WHERE source_sha256 = %s AND format = ANY(%s)",
+        (stored.sha256, list(EAGER_FORMATS)),
+    )
+    row = await cur.fetchone()
+    # identical content uploaded before already has its variants
+    if row[0] < len(EAGER_FORMATS) * len(WIDTHS):
+        await enqueue(conn, "image_variants", payload)
+
+
+# Legacy BYTEA images are read with substring() in slices of this size.
+DB_CHUNK_SIZE = 256 * 1024
+
+SpanReader = Callable[[int, int], AsyncIterator[bytes]]
+
+
+class ImageChanged(Exception):
+    """The image was replaced while its body was being sent."""
+
+
+def _bytea_reader(table: str, row_id: int, sha256: Optional[str], size: int) -> SpanReader:
+    # every slice must come from the image the headers (ETag, Content-Length) were built from
+    query = sql.SQL(
+        """
+        SELECT substring(image FROM %s FOR %s) FROM {}
+        WHERE id = %s AND image_sha256 IS NOT DISTINCT FROM %s AND octet_length(image) = %s
+        """
+    ).format(sql.Identifier(table))
+
+    async def read(start: int, end: int) -> AsyncIterator[bytes]:
+        for offset in range(start, end, DB_CHUNK_SIZE):
+            # a connection per slice, so a slow client never holds one while a slice is being sent
+            async with async_connection() as conn:
+                cur = await conn.execute(query, (offset + 1, min(DB_CHUNK_SIZE, end - offset), row_id, sha256, size))
+                row = await cur.fetchone()
+            if row is None or row[0] is None:
+                # the headers are already sent: abort the response rather than send other bytes
+                raise ImageChanged(f"{table} {row_id} image changed while it was being sent")
+            yield bytes(row[0])
+
+    return read
+
+
+def _blob_reader(key: str) -> SpanReader:
+    store = get_blob_store()
+
+    def read(start: int, end: int) -> AsyncIterator[bytes]:
+        return iterate_in_threadpool(store.iter_range(key, start, end))
+
+    return read
+
+
+async def _multipart(
+    read: SpanReader, spans: List[Tuple[int, int]], size: int, media_type: str, boundary: str
+) -> AsyncIterator[bytes]:
+    for start, end in spans:
+        yield _part_header(boundary, media_type, start, end, size)
+        async for chunk in read(start, end):
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def _part_header(boundary: str, media_type: str, start: int, end: int, size: int) -> bytes:
+    return (
+        f"\r\n--{boundary}\r\nContent-Type: {media_type}\r\n"
+        f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+    ).encode()
+
+
+def _range_response(
+    read: SpanReader, spans: List[Tuple[int, int]], size: int, media_type: str, headers: Dict[str, str]
+) -> Response:
+    if len(spans) == 1:
+        start, end = spans[0]
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(read(start, end), status_code=206, media_type=media_type, headers=headers)
+    boundary = secrets.token_hex(16)
+    length = sum(len(_part_header(boundary, media_type, s, e, size)) + e - s for s, e in spans)
+    headers["Content-Length"] = str(length + len(f"\r\n--{boundary}--\r\n"))
+    return StreamingResponse(
+        _multipart(read, spans, size, media_type, boundary),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
+
+
+async def serve_image(request: Request, table: str, row_id: int, not_found_detail: str) -> Response:
+    """Serve the image stored on ``table`` row *row_id*, honouring conditional and range requests.
+
+    Validators come from the stored image_sha256 / image_updated_at columns, so
+    a 304 never touches the image itself. Bodies are streamed in fixed-size
+    chunks: blob-store images are sent as files (or read chunk by chunk from
+    S3) and rows that still hold a BYTEA value (not yet moved by
+    ``blobstore.py migrate``) are sliced with substring(), each slice on a
+    briefly borrowed connection, so memory and pool use per request stay
+    bounded whatever the image size and client speed. ``Range`` requests (single
+    or multiple ranges, gated by ``If-Range``) read only the requested bytes.
+    ``w`` / ``format`` / ``Accept`` select a resized or re-encoded variant
+    (see derivatives.py), which then gets its own ETag.
+    """
+
+    tags = if_none_match_tags(request) or []
+    since = if_modified_since(request)
+    query = sql.SQL(
+        """
+        SELECT image_sha256,
+               image_mime,
+               image_updated_at,
+               image_key,
+               CASE WHEN image_key IS NULL THEN octet_length(image) ELSE image_size END
+        FROM {}
+        WHERE id = %s
+        """
+    ).format(sql.Identifier(table))
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, (row_id,))
+            row = await cur.fetchone()
+    if row is None or (row[3] is None and row[4] is None):
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    sha256, mime, updated_at, key, size = row
+
+    spec, varies = requested_variant(request, mime)
+    served = "original"
+    if spec is not None and sha256 is not None:
+        variant = await ensure_variant(spec, sha256, key=key, table=table, row_id=row_id)
+        if variant is not None:
+            key, size, sha256, mime = variant
+            served = spec.format
+    mark_image(request, table, served)
+
+    etag = quote_etag(sha256) if sha256 else None
+    headers: Dict[str, str] = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": "inline",
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+    }
+    if varies:
+        headers["Vary"] = "Accept"
+    if etag is not None:
+        headers["ETag"] = etag
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at)
+    matched = "*" in tags or (sha256 is not None and sha256 in tags) or (
+        since is not None and updated_at is not None and updated_at.replace(microsecond=0) <= since
+    )
+    if matched:
+        return not_modified(headers)
+    media_type = mime or "application/octet-stream"
+
+    path = None
+    if key is not None:
+        path = get_blob_store().local_path(key)
+        if path is not None:
+            if not path.is_file():
+                raise HTTPException(status_code=404, detail=not_found_detail)
+            size = path.stat().st_size
+    read = _bytea_reader(table, row_id, sha256, size) if key is None else _blob_reader(key)
+
+    spans = None
+    if size is not None and if_range_allows(request, etag, updated_at):
+        try:
+            spans = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if spans is not None:
+        return _range_response(read, spans, size, media_type, headers)
+
+    if path is not None and "range" not in request.headers:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    if size is None:
+        # an S3 blob recorded without its size: stream it to the end
+        return StreamingResponse(get_blob_store().open(key), media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(read(0, size), media_type=media_type, headers=headers)
+
+
+__all__ = ["StoredImage", "enqueue_image_jobs", "serve_image", "store_upload"]
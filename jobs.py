@@ -0,0 +1,345 @@
+"""Background jobs queued in the ``jobs`` table and run by ``python jobs.py worker``.
+
+Request handlers call ``enqueue`` inside their own transaction, so a job only
+becomes visible once the row it refers to is committed. Workers claim batches
+with ``FOR UPDATE SKIP LOCKED`` (any number of workers can poll the same
+table), run the CPU-heavy part of each task in a process pool and record the
+outcome in the same transaction that marks the job done. Failed jobs are
+retried with exponential backoff up to ``max_attempts`` times, except for
+errors retrying cannot fix (an image that does not decode, a blob that does
+not exist), which fail the job at once; jobs left
+``running`` by a worker that died are picked up again after JOB_LOCK_TIMEOUT
+seconds (default 600).
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import psycopg
+from fastapi import APIRouter, HTTPException
+from psycopg import sql
+from psycopg.types.json import Jsonb
+
+from blobstore import IMAGE_TABLES, get_blob_store
+from db import async_connection, connection, get_dsn
+from derivatives import EAGER_FORMATS, FORMATS, QUALITY, WIDTHS, ImageDecodeError, render_variant
+from schemas import Job, JobStats
+
+logger = logging.getLogger(__name__)
+
+JOBS_CHANNEL = "jobs_enqueued"
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT") or 600)
+DEFAULT_MAX_ATTEMPTS = 5
+MAX_BACKOFF = 3600
+
+
+class Task(NamedTuple):
+    """A job kind: ``run`` executes in a worker process and returns a JSON-able result,
+    ``apply`` records that result in the database while the job is marked done."""
+
+    run: Callable[[Dict[str, Any]], Dict[str, Any]]
+    apply: Optional[Callable[[psycopg.Connection, Dict[str, Any], Dict[str, Any]], None]] = None
+
+
+TASKS: Dict[str, Task] = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a task when retrying cannot help; the job fails without further attempts."""
+
+
+# errors that fail a job on its first attempt
+PERMANENT_ERRORS = (PermanentJobError, ImageDecodeError)
+
+
+def _require_blob(key: str) -> None:
+    if not get_blob_store().exists(key):
+        raise PermanentJobError(f"blob {key} does not exist")
+
+
+def _generate_variants(payload: Dict[str, Any]) -> Dict[str, Any]:
+    _require_blob(payload["key"])
+    variants = []
+    for fmt in EAGER_FORMATS:
+        for width in WIDTHS:
+            info = render_variant(payload["key"], width, fmt, QUALITY)
+            variants.append({"width": width, "format": fmt, "key": info.key, "size": info.size, "sha256": info.sha256})
+    return {"variants": variants}
+
+
+def _record_variants(conn: psycopg.Connection, payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+    with conn.cursor() as cur:
+        cur.executemany(
+            """
+            INSERT INTO image_variants (source_sha256, width, format, blob_key, size, sha256, mime)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (source_sha256, width, format) DO NOTHING
+            """,
+            [
+                (payload["sha256"], v["width"], v["format"], v["key"], v["size"], v["sha256"], FORMATS[v["format"]])
+                for v in result["variants"]
+            ],
+        )
+
+
+def _extract_metadata(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from PIL import Image, UnidentifiedImageError
+
+    _require_blob(payload["key"])
+    with get_blob_store().open(payload["key"]) as stream:
+        try:
+            # Image.open only parses the header; no pixel data is decoded
+            with Image.open(stream) as img:
+                return {"width": img.width, "height": img.height, "format": img.format}
+        except UnidentifiedImageError as exc:
+            raise PermanentJobError(str(exc)) from None
+
+
+def _record_metadata(conn: psycopg.Connection, payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+    for table in IMAGE_TABLES:
+        conn.execute(
+            sql.SQL("UPDATE {} SET image_width = %s, image_height = %s WHERE image_sha256 = %s").format(
+                sql.Identifier(table)
+            ),
+            (result["width"], result["height"], payload["sha256"]),
+        )
+
+
+TASKS["image_variants"] = Task(_generate_variants, _record_variants)
+TASKS["image_metadata"] = Task(_extract_metadata, _record_metadata)
+
+
+async def enqueue(
+    conn: psycopg.AsyncConnection, kind: str, payload: Dict[str, Any], max_attempts: int = DEFAULT_MAX_ATTEMPTS
+) -> int:
+    """Queue a *kind* job on *conn*; it runs once the surrounding transaction commits."""
+
+    if kind not in TASKS:
+        raise ValueError(f"unknown job kind {kind!r}")
+    cur = await conn.execute(
+        "INSERT INTO jobs (kind, payload, max_attempts) VALUES (%s, %s, %s) RETURNING id",
+        (kind, Jsonb(payload), max_attempts),
+    )
+    row = await cur.fetchone()
+    # NOTIFY is delivered on commit, waking idle workers without waiting for the next poll
+    await conn.execute("SELECT pg_notify(%s, %s)", (JOBS_CHANNEL, kind))
+    return row[0]
+
+
+class ClaimedJob(NamedTuple):
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+
+def _claim(worker: str, limit: int) -> List[ClaimedJob]:
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            UPDATE jobs
+            SET status = 'running',
+                attempts = attempts + 1,
+                locked_by = %s,
+                started_at = NOW(),
+                finished_at = NULL
+            WHERE id IN (
+                SELECT id
+                FROM jobs
+                WHERE (status = 'queued' AND run_at <= NOW())
+                   OR (status = 'running' AND started_at < NOW() - make_interval(secs => %s))
+                ORDER BY run_at, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, kind, payload, attempts, max_attempts
+            """,
+            (worker, JOB_LOCK_TIMEOUT, limit),
+        ).fetchall()
+    return [ClaimedJob(*row) for row in rows]
+
+
+def _init_process() -> None:
+    # Ctrl-C reaches the whole process group; let the parent decide when pool processes stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_task(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return TASKS[kind].run(payload)
+
+
+def _finish(job: ClaimedJob, future: "Future[Dict[str, Any]]") -> None:
+    error: Optional[BaseException] = future.exception()
+    if error is None:
+        try:
+            with connection() as conn:
+                task = TASKS[job.kind]
+                result = future.result()
+                if task.apply is not None:
+                    task.apply(conn, job.payload, result)
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', result = %s, last_error = NULL, finished_at = NOW() WHERE id = %s",
+                    (Jsonb(result), job.id),
+                )
+            logger.info("job %s (%s) done", job.id, job.kind)
+            return
+        except Exception as exc:
+            error = exc
+    permanent = isinstance(error, PERMANENT_ERRORS)
+    retry = not permanent and job.attempts < job.max_attempts
+    with connection() as conn:
+        conn.execute(
+            """
+            UPDATE jobs
+            SET status = %s,
+                last_error = %s,
+                finished_at = NOW(),
+                run_at = NOW() + make_interval(secs => %s)
+            WHERE id = %s
+            """,
+            ("queued" if retry else "failed", repr(error), min(2**job.attempts, MAX_BACKOFF), job.id),
+        )
+    if permanent:
+        logger.error("job %s (%s) failed permanently on attempt %s: %r", job.id, job.kind, job.attempts, error)
+    else:
+        logger.warning(
+            "job %s (%s) attempt %s/%s failed: %r", job.id, job.kind, job.attempts, job.max_attempts, error
+        )
+
+
+def _new_pool(concurrency: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context("spawn"), initializer=_init_process)
+
+
+def run_worker(concurrency: int, poll_interval: float) -> None:
+    """Claim and run jobs until SIGINT/SIGTERM, then finish the jobs in progress."""
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+
+    def stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    running: Dict["Future[Dict[str, Any]]", ClaimedJob] = {}
+    pool = _new_pool(concurrency)
+    broken = False
+    with psycopg.connect(get_dsn(), autocommit=True) as listener:
+        listener.execute(sql.SQL("LISTEN {}").format(sql.Identifier(JOBS_CHANNEL)))
+        logger.info("worker %s started with %s processes", worker, concurrency)
+        while not stopping or running:
+            if broken and not running:
+                # a pool process died (e.g. OOM-killed); its jobs were requeued, carry on with a fresh pool
+                pool.shutdown(wait=False)
+                pool = _new_pool(concurrency)
+                broken = False
+            if not stopping and not broken and len(running) < concurrency:
+                for job in _claim(worker, concurrency - len(running)):
+                    running[pool.submit(_run_task, job.kind, job.payload)] = job
+            if running:
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _finish(running.pop(future), future)
+                    broken = broken or isinstance(future.exception(), BrokenProcessPool)
+            elif not stopping:
+                for _ in listener.notifies(timeout=poll_interval, stop_after=1):
+                    pass
+    pool.shutdown()
+    logger.info("worker %s stopped", worker)
+
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/stats", response_model=list[JobStats])
+async def job_stats() -> list[JobStats]:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT kind,
+                       status,
+                       count(*),
+                       EXTRACT(EPOCH FROM NOW() - min(run_at)) FILTER (WHERE status = 'queued' AND run_at <= NOW()),
+                       avg(EXTRACT(EPOCH FROM finished_at - started_at))
+                           FILTER (WHERE finished_at > NOW() - INTERVAL '1 hour')
+                FROM jobs
+                GROUP BY kind, status
+                ORDER BY kind, status
+                """
+            )
+            rows = await cur.fetchall()
+    return [
+        JobStats(kind=r[0], status=r[1], count=r[2], oldest_wait_seconds=r[3], avg_run_seconds_last_hour=r[4])
+        for r in rows
+    ]
+
+
+@router.get("/{job_id}", response_model=Job)
+async def get_job(job_id: int) -> Job:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT id, kind, status, attempts, max_attempts, payload, result, last_error,
+                       created_at, started_at, finished_at
+                FROM jobs
+                WHERE id = %s
+                """,
+                (job_id,),
+            )
+            row = await cur.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(
+        id=row[0],
+        kind=row[1],
+        status=row[2],
+        attempts=row[3],
+        max_attempts=row[4],
+        payload=row[5],
+        result=row[6],
+        last_error=row[7],
+        created_at=row[8],
+        started_at=row[9],
+        finished_at=row[10],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run background jobs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="claim and run queued jobs")
+    worker.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    worker.add_argument("--poll-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    run_worker(args.concurrency, args.poll_interval)
+
+
+__all__ = [
+    "JOBS_CHANNEL",
+    "PERMANENT_ERRORS",
+    "TASKS",
+    "PermanentJobError",
+    "Task",
+    "enqueue",
+    "router",
+    "run_worker",
+]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,47 @@
 from fastapi.responses import JSONResponse
 """FastAPI application entry point."""
 
-from fastapi import FastAPI
+import asyncio
+import importlib
+import sys
+from typing import Optional, Set
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from banner import router as banner_router
-from tus import router as tus_router
-from db import ensure_banner_table, ensure_tus_table, ensure_database
-from facts import router as facts_router
-from db import ensure_facts_table
-from why import router as why_router
-from db import ensure_why_table
-from background import router as background_router
-from db import ensure_background_table
-from core_values import router as core_values_router
-from db import ensure_core_values_table
-from gallery import router as gallery_router
-from db import ensure_gallery_table
-from ceo import router as ceo_router
-from db import ensure_ceo_table
-from members import router as members_router
-from db import ensure_members_table
-from main_service import router as main_service_router
-from db import ensure_main_service_table
-from sub_service import router as sub_service_router
-from db import ensure_sub_service_table
-from service_test import router as service_test_router
-from db import ensure_service_test_table
+from cache import listen_for_invalidations, response_cache
+from db import async_connection, close_async_pool, close_pool, open_async_pool, pool_stats
+from metrics import MetricsMiddleware, render_metrics
+from migrate import check_schema
+from profiler import PROFILE_SQL, ProfileMiddleware
+from startup import LAZY_ROUTERS, LazyRouterMiddleware, cached_openapi
+from tracing import TracingMiddleware, configure_tracing
+from uploads import UploadLimitMiddleware
+
+# Router modules by the URL prefix they serve, in the order they are included.
+# /homepage also needs the routers whose image URLs it builds with url_for().
+ROUTERS = {
+    "/banners": ("banner",),
+    "/tus": ("tus",),
+    "/facts": ("facts",),
+    "/why": ("why",),
+    "/background": ("background",),
+    "/core-values": ("core_values",),
+    "/gallery": ("gallery",),
+    "/ceo": ("ceo",),
+    "/members": ("members",),
+    "/main-services": ("main_service",),
+    "/sub-services": ("sub_service",),
+    "/service-tests": ("service_test",),
+    "/jobs": ("jobs",),
+    "/homepage": ("homepage", "banner", "ceo", "members", "gallery"),
+    "/services": ("services",),
+    "/messages": ("messages",),
+    "/geotech-requests": ("geotech",),
+}
+
+if PROFILE_SQL:
+    ROUTERS["/debug"] = ("profiler",)
 
 app = FastAPI(title="Glowac API", version="1.0.0")
 
@@ -38,62 +53,109 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.include_router(banner_router)
-app.include_router(tus_router)
-app.include_router(facts_router)
-app.include_router(why_router)
-app.include_router(background_router)
-app.include_router(core_values_router)
-app.include_router(gallery_router)
-app.include_router(ceo_router)
-app.include_router(members_router)
-app.include_router(main_service_router)
-app.include_router(sub_service_router)
-app.include_router(service_test_router)
+app.add_middleware(UploadLimitMiddleware)
+
+_included: Set[str] = set()
+
+
+def include_router(module: str) -> None:
+    """Import *module* and add its ``router`` to the app (once)."""
+    if module not in _included:
+        _included.add(module)
+        app.include_router(importlib.import_module(module).router)
+
+
+def include_all_routers() -> None:
+    for modules in ROUTERS.values():
+        for module in modules:
+            include_router(module)
+
+
+if LAZY_ROUTERS:
+    app.add_middleware(LazyRouterMiddleware, routers=ROUTERS, load=include_router)
+else:
+    include_all_routers()
+if PROFILE_SQL:
+    app.add_middleware(ProfileMiddleware)
+app.add_middleware(MetricsMiddleware)
+configure_tracing()
+app.add_middleware(TracingMiddleware)
+app.openapi = cached_openapi(app, include_all_routers)
+
+
+_cache_listener: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def open_db_pool() -> None:
+    """Open the shared connection pool before serving requests."""
+    await open_async_pool()
+
+
+@app.on_event("startup")
+async def check_schema_version() -> None:
+    """Refuse to serve against an outdated schema (or migrate it, see MIGRATE_ON_STARTUP)."""
+    await check_schema()
+
+
+@app.on_event("startup")
+async def start_cache_listener() -> None:
+    """Follow writes made by other workers so cached lists never go stale."""
+    global _cache_listener
+    if response_cache.enabled:
+        _cache_listener = asyncio.create_task(listen_for_invalidations())
+
+
+@app.on_event("shutdown")
+async def close_db_pool() -> None:
+    """Stop the cache listener, release pooled connections and stop image workers on shutdown."""
+    if _cache_listener is not None:
+        _cache_listener.cancel()
+    await close_async_pool()
+    close_pool()
+    if "derivatives" in sys.modules:
+        sys.modules["derivatives"].shutdown_image_workers()
 
 
 # Utility to test DB connection
 def test_db_connection():
-    from db import get_database_url
+    from db import get_dsn
     import psycopg
     try:
-        url = get_database_url()
-        with psycopg.connect(url) as conn:
+        with psycopg.connect(get_dsn()) as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1;")
         return True, None
     except Exception as e:
         return False, str(e)
 
+
+async def test_db_connection_async():
+    try:
+        async with async_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT 1;")
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
 # Add endpoint to test DB connection
 @app.get("/db-test", tags=["health"])
-def db_test():
-    ok, err = test_db_connection()
+async def db_test():
+    ok, err = await test_db_connection_async()
     if ok:
         return {"db": "ok"}
     return JSONResponse(status_code=500, content={"db": "fail", "error": err})
 
-# @app.on_event("startup")
-# def on_startup() -> None:
-#     """Initialize database artifacts when the app starts."""
-#     ensure_database()
-#     ensure_banner_table()
-#     ensure_tus_table()
-#     ensure_facts_table()
-#     ensure_why_table()
-#     ensure_background_table()
-#     ensure_core_values_table()
-#     ensure_gallery_table()
-#     ensure_ceo_table()
-#     ensure_members_table()
-#     ensure_main_service_table()
-#     ensure_sub_service_table()
-#     ensure_service_test_table()
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics() -> Response:
+    return Response(**render_metrics())
 
 
 @app.get("/health", tags=["health"])
-def health() -> dict[str, str]:
-    return {"status": "ok"}
+async def health() -> dict:
+    return {"status": "ok", "pool": pool_stats(), "cache": response_cache.stats()}
 
 
 if __name__ == "__main__":
@@ -1,65 +1,77 @@
 """Routes for main services: id and service_name."""
 
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-import psycopg
-
-from db import get_dsn
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json
 from schemas import MainService
 
 router = APIRouter(prefix="/main-services", tags=["main-service"])
 
+_LIST_QUERY = "SELECT id, service_name FROM main_service ORDER BY id"
+
 
 @router.get("", response_model=list[MainService])
-def list_services() -> list[MainService]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, service_name FROM main_service ORDER BY id")
-            rows = cur.fetchall()
+async def list_services(request: Request) -> Response:
+    return await cached_response(request, "main_service", "", _load_services)
+
+
+async def _load_services() -> Union[list[MainService], bytes]:
+    if FAST_JSON:
+        return await fetch_json(_LIST_QUERY)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_LIST_QUERY)
+            rows = await cur.fetchall()
     return [MainService(id=r[0], service_name=r[1]) for r in rows]
 
 
 @router.post("", response_model=MainService, status_code=201)
-def create_service(service_name: str = Form(...)) -> MainService:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def create_service(service_name: str = Form(...)) -> MainService:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO main_service (service_name) VALUES (%s) RETURNING id, service_name",
                 (service_name,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create service")
+    response_cache.invalidate("main_service")
     return MainService(id=row[0], service_name=row[1])
 
 
 @router.put("/{service_id}", response_model=MainService)
-def update_service(service_id: int, service_name: Optional[str] = Form(None)) -> MainService:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT service_name FROM main_service WHERE id = %s", (service_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Service not found")
-            cur.execute(
-                "UPDATE main_service SET service_name = %s WHERE id = %s RETURNING id, service_name",
-                (service_name if service_name is not None else current[0], service_id),
+@router.patch("/{service_id}", response_model=MainService)
+async def update_service(service_id: int, service_name: Optional[str] = Form(None)) -> MainService:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "UPDATE main_service SET service_name = COALESCE(%s, service_name) WHERE id = %s"
+                " RETURNING id, service_name",
+                (service_name, service_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update service")
+        raise HTTPException(status_code=404, detail="Service not found")
+    response_cache.invalidate("main_service")
     return MainService(id=row[0], service_name=row[1])
 
 
 @router.delete("/{service_id}", status_code=204)
-def delete_service(service_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM main_service WHERE id = %s", (service_id,))
+async def delete_service(service_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM main_service WHERE id = %s", (service_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Service not found")
+    response_cache.invalidate("main_service")
+    # sub services and their tests are removed by ON DELETE CASCADE
+    response_cache.invalidate("sub_service")
+    response_cache.invalidate("service_test")
     return None
 
 
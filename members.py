@@ -2,25 +2,39 @@
 
 from typing import Optional
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, Request, Response
 
-import psycopg
-
-from db import get_dsn
+from cache import cached_response, response_cache
+from db import async_connection
+from images import enqueue_image_jobs, serve_image, store_upload
+from pagination import DEFAULT_PAGE_SIZE, Cursor, Page, PageSize, id_cursor, paginate
 from schemas import Member
 
 router = APIRouter(prefix="/members", tags=["members"])
 
 
 @router.get("", response_model=list[Member])
-def list_members(request: Request) -> list[Member]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, name, title, email, image_mime, short_description FROM members ORDER BY id"
+async def list_members(request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None) -> Response:
+    after_id = id_cursor(after)
+    return await cached_response(
+        request, "members", str(request.base_url), lambda: _load_members(request, limit, after_id)
+    )
+
+
+async def _load_members(request: Request, limit: int, after_id: int) -> Page:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT id, name, title, email, image_mime, short_description
+                FROM members
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+                """,
+                (after_id, limit + 1),
             )
-            rows = cur.fetchall()
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: str(r[0]))
     results: list[Member] = []
     for r in rows:
         id_ = r[0]
@@ -36,43 +50,55 @@ def list_members(request: Request) -> list[Member]:
                 short_description=r[5],
             )
         )
-    return results
+    return Page(results, next_cursor)
 
 
 @router.post("", response_model=Member, status_code=201)
-def create_member(
+async def create_member(
     name: str = Form(...),
     title: str = Form(...),
     email: str = Form(...),
     image: Optional[UploadFile] = File(None),
     short_description: Optional[str] = Form(None),
 ) -> Member:
-    image_bytes = None
-    image_mime = None
-    if image is not None:
-        image_bytes = image.file.read()
-        image.file.close()
-        image_mime = image.content_type or "application/octet-stream"
-
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    stored = await store_upload(image) if image is not None else None
+
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
-                INSERT INTO members (name, title, email, image, image_mime, short_description)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                INSERT INTO members (
+                    name, title, email, short_description,
+                    image_key, image_mime, image_size, image_sha256, image_updated_at
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING id, name, title, email, image_mime, short_description
                 """,
-                (name, title, email, psycopg.Binary(image_bytes) if image_bytes else None, image_mime, short_description),
+                (
+                    name,
+                    title,
+                    email,
+                    short_description,
+                    stored and stored.key,
+                    stored and stored.mime,
+                    stored and stored.size,
+                    stored and stored.sha256,
+                    stored and stored.updated_at,
+                ),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
+            if row is not None:
+                await enqueue_image_jobs(conn, stored)
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create member")
     preview_url = f"/members/{row[0]}/image"
+    response_cache.invalidate("members")
     return Member(id=row[0], name=row[1], title=row[2], email=row[3], image_url=preview_url, image_mime=row[4], short_description=row[5])
 
 
 @router.put("/{member_id}", response_model=Member)
-def update_member(
+@router.patch("/{member_id}", response_model=Member)
+async def update_member(
     member_id: int,
     name: Optional[str] = Form(None),
     title: Optional[str] = Form(None),
@@ -80,74 +106,64 @@ def update_member(
     image: Optional[UploadFile] = File(None),
     short_description: Optional[str] = Form(None),
 ) -> Member:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT name, title, email, image, image_mime, short_description FROM members WHERE id = %s",
-                (member_id,),
-            )
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Member not found")
-
-            image_bytes = current[3]
-            image_mime = current[4]
-            if image is not None:
-                new_bytes = image.file.read()
-                image.file.close()
-                image_bytes = new_bytes
-                image_mime = image.content_type or "application/octet-stream"
+    stored = await store_upload(image) if image is not None else None
 
-            cur.execute(
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE members
-                SET name = %s,
-                    title = %s,
-                    email = %s,
-                    image = %s,
-                    image_mime = %s,
-                    short_description = %s
+                SET name = COALESCE(%s, name),
+                    title = COALESCE(%s, title),
+                    email = COALESCE(%s, email),
+                    short_description = COALESCE(%s, short_description),
+                    image = CASE WHEN %s THEN NULL ELSE image END,
+                    image_key = COALESCE(%s, image_key),
+                    image_mime = COALESCE(%s, image_mime),
+                    image_size = COALESCE(%s, image_size),
+                    image_sha256 = COALESCE(%s, image_sha256),
+                    image_updated_at = COALESCE(%s, image_updated_at)
                 WHERE id = %s
                 RETURNING id, name, title, email, image_mime, short_description
                 """,
                 (
-                    name if name is not None else current[0],
-                    title if title is not None else current[1],
-                    email if email is not None else current[2],
-                    psycopg.Binary(image_bytes) if image_bytes is not None else None,
-                    image_mime,
-                    short_description if short_description is not None else current[5],
+                    name,
+                    title,
+                    email,
+                    short_description,
+                    stored is not None,
+                    stored and stored.key,
+                    stored and stored.mime,
+                    stored and stored.size,
+                    stored and stored.sha256,
+                    stored and stored.updated_at,
                     member_id,
                 ),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
+            if row is not None:
+                await enqueue_image_jobs(conn, stored)
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update member")
+        raise HTTPException(status_code=404, detail="Member not found")
     preview_url = f"/members/{row[0]}/image"
+    response_cache.invalidate("members")
     return Member(id=row[0], name=row[1], title=row[2], email=row[3], image_url=preview_url, image_mime=row[4], short_description=row[5])
 
 
 @router.delete("/{member_id}", status_code=204)
-def delete_member(member_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM members WHERE id = %s", (member_id,))
+async def delete_member(member_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM members WHERE id = %s", (member_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Member not found")
+    response_cache.invalidate("members")
     return None
 
 
 @router.get("/{member_id}/image", name="get_member_image")
-def get_member_image(member_id: int) -> StreamingResponse:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT image, image_mime FROM members WHERE id = %s", (member_id,))
-            row = cur.fetchone()
-    if row is None or row[0] is None:
-        raise HTTPException(status_code=404, detail="Image not found")
-    media_type = row[1] or "application/octet-stream"
-    headers = {"Content-Disposition": "inline"}
-    return StreamingResponse(iter([bytes(row[0])]), media_type=media_type, headers=headers)
+async def get_member_image(member_id: int, request: Request) -> Response:
+    return await serve_image(request, "members", member_id, "Image not found")
 
 
 __all__ = ["router"]
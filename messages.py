@@ -1,41 +1,84 @@
-"""Routes for collecting contact messages (create-only + list)."""
+"""Routes for collecting contact messages (public create; list and export need the admin token)."""
 
 from typing import Optional
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 
-import psycopg
-
-from db import get_dsn
+from admin import require_admin
+from db import async_connection
+from exports import EXPORT_RESPONSES, ExportFormat, Gzip, Since, Until, export_response
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    Cursor,
+    Page,
+    PageSize,
+    encode_time_cursor,
+    page_response,
+    paginate,
+    time_cursor,
+)
 from schemas import Message, MessageResponse
 
+MESSAGE_COLUMNS = ("id", "name", "email", "message", "created_at")
+
 router = APIRouter(prefix="/messages", tags=["messages"])
 
 
 @router.post("", response_model=MessageResponse, status_code=201)
-def create_message(
+async def create_message(
     name: str = Form(...), email: str = Form(...), message: str = Form(...)
 ) -> MessageResponse:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO messages (name, email, message) VALUES (%s, %s, %s) RETURNING id, name, email, message, created_at",
                 (name, email, message),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to save message")
     stored = Message(id=row[0], name=row[1], email=row[2], message=row[3], created_at=row[4])
     return MessageResponse(message="Thank you for contacting us — our team will get back to you soon.", data=stored)
 
 
-@router.get("", response_model=list[Message])
-def list_messages() -> list[Message]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, name, email, message, created_at FROM messages ORDER BY created_at DESC")
-            rows = cur.fetchall()
-    return [Message(id=r[0], name=r[1], email=r[2], message=r[3], created_at=r[4]) for r in rows]
+@router.get("", response_model=list[Message], dependencies=[Depends(require_admin)])
+async def list_messages(request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None) -> Response:
+    cursor = time_cursor(after)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            # two statements rather than "%s IS NULL OR ...", so both plan as a plain index range scan
+            if cursor is None:
+                await cur.execute(
+                    "SELECT id, name, email, message, created_at FROM messages ORDER BY created_at DESC, id DESC LIMIT %s",
+                    (limit + 1,),
+                )
+            else:
+                await cur.execute(
+                    """
+                    SELECT id, name, email, message, created_at
+                    FROM messages
+                    WHERE (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (*cursor, limit + 1),
+                )
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: encode_time_cursor(r[4], r[0]))
+    items = [Message(id=r[0], name=r[1], email=r[2], message=r[3], created_at=r[4]) for r in rows]
+    return page_response(request, Page(items, next_cursor))
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses=EXPORT_RESPONSES,
+    dependencies=[Depends(require_admin)],
+)
+async def export_messages(
+    format: ExportFormat = "ndjson", since: Since = None, until: Until = None, gzip: Gzip = False
+) -> StreamingResponse:
+    return export_response("messages", MESSAGE_COLUMNS, format, since, until, gzip)
 
 
 __all__ = ["router"]
@@ -0,0 +1,171 @@
+"""Prometheus metrics, exposed by ``GET /metrics``.
+
+Requests are labelled by route template (``/banners/{banner_id}/image-preview``),
+never by raw path; requests that match no route share the ``unmatched`` label.
+Database timings come from the cursor class installed on the pools (see
+``db.InstrumentedAsyncCursor``) and carry the route of the request that ran them, or
+``none`` outside a request (jobs, scripts).
+
+With several server processes, set PROMETHEUS_MULTIPROC_DIR to a directory
+shared by them (emptied on deploy) so ``/metrics`` aggregates all of them.
+"""
+
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response was fully sent",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_BYTES = Histogram("http_response_size_bytes", "Response body size", ["method", "route"], buckets=SIZE_BUCKETS)
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being served", ["method"], multiprocess_mode="livesum")
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Time spent executing queries", ["route"], buckets=DB_BUCKETS)
+DB_ROWS = Counter("db_rows_total", "Rows returned (or affected) by queries", ["route"])
+DB_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds", "Time waiting for a pooled connection", ["pool"], buckets=DB_BUCKETS
+)
+IMAGE_BYTES = Counter("image_bytes_served_total", "Image bytes sent", ["table", "variant"])
+
+_scope: ContextVar[Optional[Scope]] = ContextVar("metrics_scope", default=None)
+
+
+def route_label(scope: Optional[Scope]) -> str:
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def mark_image(request: Any, table: str, variant: str) -> None:
+    """Count the body of *request*'s response as image bytes for *table* / *variant*."""
+
+    request.state.image_metrics = (table, variant)
+
+
+class MetricsMiddleware:
+    """Count, time and size every HTTP request by route template."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        sent = 0
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        token = _scope.set(scope)
+        IN_PROGRESS.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_PROGRESS.labels(method).dec()
+            _scope.reset(token)
+            route = route_label(scope)
+            REQUESTS.labels(method, route, str(status)).inc()
+            REQUEST_SECONDS.labels(method, route).observe(time.perf_counter() - started)
+            RESPONSE_BYTES.labels(method, route).observe(sent)
+            image = scope.get("state", {}).get("image_metrics")
+            if image is not None:
+                IMAGE_BYTES.labels(*image).inc(sent)
+
+
+def current_route() -> str:
+    """Return the route label of the request being served in this context."""
+
+    return route_label(_scope.get())
+
+
+def observe_query(cur: Any, seconds: float) -> None:
+    """Record a statement that ran on *cur* for *seconds*."""
+
+    route = current_route()
+    DB_QUERY_SECONDS.labels(route).observe(seconds)
+    # in pipeline mode the result (and so rowcount) is not known yet
+    if cur.rowcount > 0:
+        DB_ROWS.labels(route).inc(cur.rowcount)
+
+
+class PoolCollector:
+    """Expose the pool usage counters from ``db.pool_stats`` at scrape time."""
+
+    def _families(self) -> Tuple[GaugeMetricFamily, GaugeMetricFamily]:
+        return (
+            GaugeMetricFamily("db_pool_connections", "Pooled connections by state", labels=["pool", "state"]),
+            GaugeMetricFamily("db_pool_waiting", "Requests waiting for a connection", labels=["pool"]),
+        )
+
+    def describe(self) -> Tuple[GaugeMetricFamily, GaugeMetricFamily]:
+        return self._families()
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        from db import pool_stats
+
+        family, waiting = self._families()
+        for pool, stats in pool_stats().items():
+            if stats.get("open"):
+                family.add_metric([pool, "in_use"], stats["in_use"])
+                family.add_metric([pool, "idle"], stats["idle"])
+                waiting.add_metric([pool], stats["waiting"])
+        yield family
+        yield waiting
+
+
+REGISTRY.register(PoolCollector())
+
+
+def render_metrics() -> Dict[str, Any]:
+    """Return the body and media type for a ``/metrics`` response."""
+
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector())
+    else:
+        registry = REGISTRY
+    return {"content": generate_latest(registry), "media_type": CONTENT_TYPE_LATEST}
+
+
+__all__ = [
+    "DB_ACQUIRE_SECONDS",
+    "MetricsMiddleware",
+    "current_route",
+    "mark_image",
+    "observe_query",
+    "render_metrics",
+    "route_label",
+]
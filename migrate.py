@@ -0,0 +1,196 @@
+"""Versioned schema migrations: ``python migrate.py up`` / ``python migrate.py status``.
+
+Migrations live in ``migrations/`` as ``NNNN_description.sql`` (run as-is) or
+``NNNN_description.py`` (defining ``upgrade(cur)``). Each one is applied in its
+own transaction and recorded in ``schema_migrations`` together with a checksum
+of its source. A run uses a single connection and holds an advisory lock, so
+any number of processes may call ``migrate()`` at once: the first applies the
+pending migrations and the others wait, then find nothing left to do.
+
+Application startup only compares the recorded version with the newest file
+(see ``check_schema``); MIGRATE_ON_STARTUP selects what happens when they
+differ: ``check`` (default) refuses to start, ``apply`` runs the migrations and
+``off`` skips the check.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import psycopg
+
+from db import async_connection, ensure_database, get_dsn
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATE_ON_STARTUP = (os.getenv("MIGRATE_ON_STARTUP") or "check").lower()
+# arbitrary, but fixed: every process must agree on it
+MIGRATION_LOCK_ID = 0x676C6F776163
+
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.(sql|py)$")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: Path
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Return the migrations in *directory* ordered by version."""
+
+    found: Dict[int, Migration] = {}
+    for path in directory.iterdir():
+        match = _FILENAME.match(path.name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in found:
+            raise SystemExit(f"Duplicate migration version {version}: {found[version].path.name}, {path.name}")
+        found[version] = Migration(version, match.group(2), path)
+    return [found[v] for v in sorted(found)]
+
+
+def latest_version() -> int:
+    migrations = discover()
+    return migrations[-1].version if migrations else 0
+
+
+def _ensure_migrations_table(conn: psycopg.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+
+
+def _applied(conn: psycopg.Connection) -> Dict[int, str]:
+    return dict(conn.execute("SELECT version, checksum FROM schema_migrations").fetchall())
+
+
+def _apply(conn: psycopg.Connection, migration: Migration) -> None:
+    with conn.transaction():
+        with conn.cursor() as cur:
+            if migration.path.suffix == ".sql":
+                # no parameters, so psycopg sends the whole file as one simple query
+                cur.execute(migration.path.read_text(encoding="utf-8"))
+            else:
+                spec = importlib.util.spec_from_file_location(f"migrations.m{migration.path.stem}", migration.path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                module.upgrade(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (migration.version, migration.name, migration.checksum),
+            )
+
+
+def migrate(target: Optional[int] = None) -> List[Migration]:
+    """Apply every pending migration up to *target* (default: all) and return them."""
+
+    migrations = [m for m in discover() if target is None or m.version <= target]
+    with psycopg.connect(get_dsn(), autocommit=True) as conn:
+        conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            _ensure_migrations_table(conn)
+            applied = _applied(conn)
+            pending = [m for m in migrations if m.version not in applied]
+            for migration in pending:
+                logger.info("Applying migration %04d_%s", migration.version, migration.name)
+                _apply(conn, migration)
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return pending
+
+
+def status() -> List[str]:
+    """Describe every known migration as applied, pending or modified since it was applied."""
+
+    with psycopg.connect(get_dsn(), autocommit=True) as conn:
+        _ensure_migrations_table(conn)
+        applied = _applied(conn)
+    migrations = discover()
+    lines = []
+    for migration in migrations:
+        if migration.version not in applied:
+            state = "pending"
+        elif applied[migration.version] != migration.checksum:
+            state = "modified"
+        else:
+            state = "applied"
+        lines.append(f"{migration.version:04d}_{migration.name}: {state}")
+    known = {m.version for m in migrations}
+    missing = sorted(v for v in applied if v not in known)
+    lines.extend(f"{v:04d}: applied but missing from {MIGRATIONS_DIR.name}/" for v in missing)
+    return lines
+
+
+async def current_version() -> int:
+    """Return the newest applied migration (0 for a database never migrated)."""
+
+    async with async_connection() as conn:
+        try:
+            cur = await conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        except psycopg.errors.UndefinedTable:
+            return 0
+        row = await cur.fetchone()
+    return row[0]
+
+
+async def check_schema() -> None:
+    """Startup hook: make sure the database schema matches this code (see MIGRATE_ON_STARTUP)."""
+
+    if MIGRATE_ON_STARTUP == "off":
+        return
+    expected = latest_version()
+    version = await current_version()
+    if version >= expected:
+        return
+    if MIGRATE_ON_STARTUP == "apply":
+        await asyncio.to_thread(migrate)
+        return
+    raise RuntimeError(
+        f"Database schema is at version {version} but this code needs {expected}; run `python migrate.py up`."
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    up = commands.add_parser("up", help="apply pending migrations")
+    up.add_argument("--to", type=int, default=None, help="stop after this version")
+    up.add_argument("--create-database", action="store_true", help="create the target database first")
+    commands.add_parser("status", help="list applied and pending migrations")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "up":
+        if args.create_database:
+            ensure_database()
+        applied = migrate(args.to)
+        print(f"Applied {len(applied)} migrations." if applied else "Schema is up to date.")
+    else:
+        print("\n".join(status()))
+
+
+__all__ = ["MIGRATIONS_DIR", "Migration", "check_schema", "current_version", "discover", "latest_version", "migrate"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+-- Content tables, as previously created by the ensure_*_table functions in db.py.
+-- Every statement is idempotent so databases set up by those functions can be
+-- brought under migration control unchanged.
+
+CREATE TABLE IF NOT EXISTS banner (
+    id BIGSERIAL PRIMARY KEY,
+    highlight_tag TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    image BYTEA,
+    image_mime TEXT
+);
+ALTER TABLE banner ADD COLUMN IF NOT EXISTS image_mime TEXT;
+
+CREATE TABLE IF NOT EXISTS tus (
+    id BIGSERIAL PRIMARY KEY,
+    day TEXT NOT NULL,
+    hours TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Open'
+);
+
+CREATE TABLE IF NOT EXISTS facts (
+    id BIGSERIAL PRIMARY KEY,
+    label TEXT NOT NULL,
+    number BIGINT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Visible'
+);
+
+CREATE TABLE IF NOT EXISTS why_choose_us (
+    id BIGSERIAL PRIMARY KEY,
+    label TEXT NOT NULL,
+    value TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Visible'
+);
+
+CREATE TABLE IF NOT EXISTS background (
+    id BIGSERIAL PRIMARY KEY,
+    paragraph TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS core_values (
+    id BIGSERIAL PRIMARY KEY,
+    bullet_text TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS gallery (
+    id BIGSERIAL PRIMARY KEY,
+    image BYTEA,
+    image_mime TEXT
+);
+ALTER TABLE gallery ALTER COLUMN image DROP NOT NULL;
+
+CREATE TABLE IF NOT EXISTS ceo_card (
+    id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    title TEXT NOT NULL,
+    email TEXT NOT NULL,
+    image_url TEXT,
+    short_description TEXT
+);
+ALTER TABLE ceo_card
+ADD COLUMN IF NOT EXISTS image BYTEA,
+ADD COLUMN IF NOT EXISTS image_mime TEXT;
+
+CREATE TABLE IF NOT EXISTS members (
+    id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    title TEXT NOT NULL,
+    email TEXT NOT NULL,
+    image_url TEXT,
+    short_description TEXT
+);
+ALTER TABLE members
+ADD COLUMN IF NOT EXISTS image BYTEA,
+ADD COLUMN IF NOT EXISTS image_mime TEXT;
+
+CREATE TABLE IF NOT EXISTS main_service (
+    id BIGSERIAL PRIMARY KEY,
+    service_name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sub_service (
+    id BIGSERIAL PRIMARY KEY,
+    main_service_id BIGINT NOT NULL REFERENCES main_service(id) ON DELETE CASCADE,
+    service_name TEXT NOT NULL,
+    description TEXT
+);
+-- (main_service_id, id) serves both the FK cascade and keyset pages of /by-main
+CREATE INDEX IF NOT EXISTS idx_sub_service_main_id_id ON sub_service(main_service_id, id);
+DROP INDEX IF EXISTS idx_sub_service_main_id;
+
+CREATE TABLE IF NOT EXISTS service_test (
+    id BIGSERIAL PRIMARY KEY,
+    main_service_id BIGINT NOT NULL REFERENCES main_service(id) ON DELETE CASCADE,
+    sub_service_id BIGINT NOT NULL REFERENCES sub_service(id) ON DELETE CASCADE,
+    test_name TEXT NOT NULL,
+    description TEXT
+);
+-- (sub_service_id, id) serves both the FK cascade and keyset pages of /by-sub
+CREATE INDEX IF NOT EXISTS idx_service_test_sub_id_id ON service_test(sub_service_id, id);
+DROP INDEX IF EXISTS idx_service_test_sub_id;
+
+CREATE TABLE IF NOT EXISTS messages (
+    id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_messages_created_at_id ON messages(created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS geotech_requests (
+    id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    project_details TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_geotech_requests_created_at_id ON geotech_requests(created_at DESC, id DESC);
@@ -0,0 +1,37 @@
+"""Blob-store key/size, the hash/timestamp used for image validators and the pixel
+dimensions filled in by the ``image_metadata`` job.
+
+``image`` (BYTEA) only remains for rows not yet moved by ``blobstore.py migrate``.
+"""
+
+import psycopg
+from psycopg import sql
+
+TABLES = ("banner", "gallery", "ceo_card", "members")
+
+
+def upgrade(cur: psycopg.Cursor) -> None:
+    for table in TABLES:
+        cur.execute(
+            sql.SQL(
+                """
+                ALTER TABLE {}
+                ADD COLUMN IF NOT EXISTS image_key TEXT,
+                ADD COLUMN IF NOT EXISTS image_size BIGINT,
+                ADD COLUMN IF NOT EXISTS image_sha256 TEXT,
+                ADD COLUMN IF NOT EXISTS image_updated_at TIMESTAMPTZ,
+                ADD COLUMN IF NOT EXISTS image_width INTEGER,
+                ADD COLUMN IF NOT EXISTS image_height INTEGER
+                """
+            ).format(sql.Identifier(table))
+        )
+        cur.execute(
+            sql.SQL(
+                """
+                UPDATE {}
+                SET image_sha256 = encode(sha256(image), 'hex'),
+                    image_updated_at = COALESCE(image_updated_at, NOW())
+                WHERE image IS NOT NULL AND image_sha256 IS NULL
+                """
+            ).format(sql.Identifier(table))
+        )
@@ -0,0 +1,46 @@
+"""Content tables notify "<table>_changed" after every write statement so each
+worker can drop its cached copies (see db.change_channel and
+cache.listen_for_invalidations).
+"""
+
+import psycopg
+from psycopg import sql
+
+TABLES = (
+    "banner",
+    "tus",
+    "facts",
+    "why_choose_us",
+    "background",
+    "core_values",
+    "gallery",
+    "ceo_card",
+    "members",
+    "main_service",
+    "sub_service",
+    "service_test",
+)
+
+
+def upgrade(cur: psycopg.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(TG_TABLE_NAME || '_changed', TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    for table in TABLES:
+        trigger = sql.Identifier(f"{table}_notify_change")
+        cur.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {}").format(trigger, sql.Identifier(table)))
+        cur.execute(
+            sql.SQL(
+                """
+                CREATE TRIGGER {} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change()
+                """
+            ).format(trigger, sql.Identifier(table))
+        )
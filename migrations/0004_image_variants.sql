@@ -0,0 +1,14 @@
+-- Resized/re-encoded copies of images (see derivatives.py). Variants are keyed
+-- by the source content hash, so identical uploads share them.
+
+CREATE TABLE IF NOT EXISTS image_variants (
+    source_sha256 TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    blob_key TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    sha256 TEXT NOT NULL,
+    mime TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (source_sha256, width, format)
+);
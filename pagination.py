@@ -0,0 +1,110 @@
+"""Keyset pagination for list endpoints.
+
+Paginated lists take ``?limit=`` (default DEFAULT_PAGE_SIZE, at most
+MAX_PAGE_SIZE) and ``?after=<cursor>``. The body stays a plain JSON array; when
+more rows follow, the cursor for the next page is sent in ``X-Next-Cursor``
+and as a relative ``Link: <...>; rel="next"`` URL. Lists ordered by id use the
+last id as cursor, lists ordered by ``(created_at, id)`` an opaque token.
+"""
+
+import base64
+import os
+from datetime import datetime
+from typing import Annotated, Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, Query, Request, Response
+from pydantic_core import to_json
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE") or 50)
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE") or 200)
+
+PageSize = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE, description="Number of items per page")]
+Cursor = Annotated[Optional[str], Query(description="next_cursor of the previous page")]
+
+
+class Page(NamedTuple):
+    items: Sequence[Any]
+    next_cursor: Optional[str]
+
+
+# ids are BIGINT; anything larger would fail in Postgres instead of with a 400
+MAX_ID = 2**63 - 1
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def _parse_id(raw: str) -> int:
+    # isdigit() alone also accepts non-ASCII digits such as "١٢"
+    if not (raw.isascii() and raw.isdigit()) or len(raw) > 19 or int(raw) > MAX_ID:
+        raise _invalid_cursor()
+    return int(raw)
+
+
+def id_cursor(after: Optional[str]) -> int:
+    """Return the id to continue after (0 for the first page)."""
+
+    if after is None:
+        return 0
+    return _parse_id(after)
+
+
+def encode_time_cursor(created_at: datetime, id_: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id_}".encode()).decode().rstrip("=")
+
+
+def time_cursor(after: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Decode a ``(created_at, id)`` cursor; None for the first page."""
+
+    if after is None:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(after + "=" * (-len(after) % 4)).decode()
+        created_at, id_ = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), _parse_id(id_)
+    except ValueError:
+        raise _invalid_cursor()
+
+
+def paginate(rows: Sequence[Any], limit: int, cursor_of: Callable[[Any], str]) -> Tuple[List[Any], Optional[str]]:
+    """Split *rows*, fetched with ``LIMIT limit + 1``, into the page and the next cursor."""
+
+    page = list(rows[:limit])
+    next_cursor = cursor_of(page[-1]) if len(rows) > limit else None
+    return page, next_cursor
+
+
+def page_headers(request: Request, next_cursor: Optional[str]) -> Dict[str, str]:
+    if next_cursor is None:
+        return {}
+    params = [(k, v) for k, v in request.query_params.multi_items() if k != "after"]
+    params.append(("after", next_cursor))
+    return {
+        "X-Next-Cursor": next_cursor,
+        "Link": f'<{request.url.path}?{urlencode(params)}>; rel="next"',
+    }
+
+
+def page_response(request: Request, page: Page) -> Response:
+    return Response(
+        content=to_json(page.items),
+        media_type="application/json",
+        headers=page_headers(request, page.next_cursor),
+    )
+
+
+__all__ = [
+    "Cursor",
+    "DEFAULT_PAGE_SIZE",
+    "MAX_PAGE_SIZE",
+    "Page",
+    "PageSize",
+    "encode_time_cursor",
+    "id_cursor",
+    "page_headers",
+    "page_response",
+    "paginate",
+    "time_cursor",
+]
@@ -0,0 +1,246 @@
+"""Slow-query log and an opt-in per-route SQL profile.
+
+Every statement run through the pools (see ``db.InstrumentedAsyncCursor``) that
+takes at least SLOW_QUERY_MS milliseconds (default 500, 0 disables the log) is
+logged on the ``slow_query`` logger with its duration, row count, calling
+route and the shape of its parameters (their types, never their values).
+
+With PROFILE_SQL=1 each request's time is split into database time (running
+statements) and Python time (everything else) and aggregated per route, and
+the slowest call of each statement is kept with its parameters.
+``GET /debug/profile`` reports it; with ``?explain=true`` the captured SELECTs
+are also run under ``EXPLAIN (ANALYZE, BUFFERS)``, e.g. to see whether
+``ORDER BY created_at DESC`` on messages has started to scan the whole table.
+``DELETE /debug/profile`` resets it. These routes only exist while profiling
+is on, because the captured parameters are real request data.
+"""
+
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Mapping, Optional
+
+import psycopg
+from fastapi import APIRouter, Query, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import current_route, route_label
+from tracing import query_text
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS") or 500)
+PROFILE_SQL = (os.getenv("PROFILE_SQL") or "0") not in ("0", "false", "no")
+# distinct statements kept per route; the rest only count towards its database time
+PROFILE_MAX_STATEMENTS = int(os.getenv("PROFILE_MAX_STATEMENTS") or 50)
+
+slow_query_logger = logging.getLogger("slow_query")
+
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return "None"
+    if isinstance(value, (list, tuple, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(params: Any, batch: Optional[int] = None) -> str:
+    """Describe *params* by type, like ``(str, int)``; ``batch`` prefixes ``executemany`` calls with their count."""
+
+    if batch is not None:
+        return f"{batch} x {params_shape(params[0]) if params else '()'}"
+    if params is None:
+        return "()"
+    if isinstance(params, Mapping):
+        return "{" + ", ".join(f"{key}: {_type_name(value)}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(_type_name(value) for value in params) + ")"
+
+
+class StatementProfile:
+    """Calls and timings of one statement under one route, with its slowest call's parameters."""
+
+    __slots__ = ("query", "calls", "seconds", "max_seconds", "rows", "params", "shape")
+
+    def __init__(self, query: str) -> None:
+        self.query = query
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.params: Any = None
+        self.shape = "()"
+
+    def add(self, seconds: float, rows: int, params: Any, shape: str) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.rows += max(rows, 0)
+        if seconds >= self.max_seconds:
+            self.max_seconds = seconds
+            self.params = params
+            self.shape = shape
+
+
+class RouteProfile:
+    """Request count and wall / database time of one route."""
+
+    __slots__ = ("requests", "seconds", "db_seconds", "statements")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.statements: Dict[str, StatementProfile] = {}
+
+
+class _RequestProfile:
+    __slots__ = ("db_seconds", "statements")
+
+    def __init__(self) -> None:
+        self.db_seconds = 0.0
+        self.statements: List[Any] = []
+
+
+_routes: Dict[str, RouteProfile] = {}
+_request: ContextVar[Optional[_RequestProfile]] = ContextVar("profile_request", default=None)
+
+
+def record_query(cur: Any, query: Any, params: Any, seconds: float, batch: Optional[int] = None) -> None:
+    """Log *query* if it was slow and add it to the current request's profile (called by the db cursors)."""
+
+    slow = SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS
+    profile = _request.get()
+    if not slow and profile is None:
+        return
+    text = query_text(query, cur)
+    shape = params_shape(params, batch)
+    if slow:
+        slow_query_logger.warning(
+            "%.1f ms, %d rows, route %s, params %s: %s",
+            seconds * 1000,
+            cur.rowcount,
+            current_route(),
+            shape,
+            " ".join(text.split()),
+        )
+    if profile is not None:
+        profile.db_seconds += seconds
+        first = params[0] if batch and params else params
+        profile.statements.append((text, seconds, cur.rowcount, first, shape))
+
+
+class ProfileMiddleware:
+    """Split each request's time into database and Python time, per route template."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = _RequestProfile()
+        token = _request.set(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+            route = _routes.setdefault(route_label(scope), RouteProfile())
+            route.requests += 1
+            route.seconds += time.perf_counter() - started
+            route.db_seconds += profile.db_seconds
+            for text, seconds, rows, params, shape in profile.statements:
+                statement = route.statements.get(text)
+                if statement is None:
+                    if len(route.statements) >= PROFILE_MAX_STATEMENTS:
+                        continue
+                    statement = route.statements[text] = StatementProfile(text)
+                statement.add(seconds, rows, params, shape)
+
+
+def _seq_scans(plan: Mapping[str, Any]) -> List[str]:
+    found = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", ()):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def explain(conn: psycopg.AsyncConnection, statement: StatementProfile) -> Dict[str, Any]:
+    """Run *statement* with its slowest parameters under ``EXPLAIN (ANALYZE, BUFFERS)``, rolled back."""
+
+    if statement.query.lstrip().split(None, 1)[0].upper() != "SELECT":
+        return {"skipped": "only SELECT statements are explained"}
+    try:
+        async with conn.transaction(force_rollback=True):
+            cur = await conn.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement.query, statement.params)
+            row = await cur.fetchone()
+    except psycopg.Error as exc:
+        return {"error": str(exc).strip()}
+    plan = row[0][0]
+    return {
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "seq_scans": _seq_scans(plan["Plan"]),
+        "plan": plan["Plan"],
+    }
+
+
+router = APIRouter(prefix="/debug", tags=["debug"], include_in_schema=False)
+
+
+@router.get("/profile")
+async def get_profile(
+    route: Optional[str] = None,
+    explain_queries: bool = Query(False, alias="explain"),
+    top: int = Query(10, ge=1, le=PROFILE_MAX_STATEMENTS),
+) -> Dict[str, Any]:
+    """Per-route database vs Python time, with each route's *top* statements by total time."""
+
+    from db import async_connection
+
+    report: Dict[str, Any] = {}
+    for label, profile in sorted(_routes.items(), key=lambda item: item[1].seconds, reverse=True):
+        if route is not None and label != route:
+            continue
+        statements = sorted(profile.statements.values(), key=lambda s: s.seconds, reverse=True)[:top]
+        queries = []
+        for statement in statements:
+            entry = {
+                "query": " ".join(statement.query.split()),
+                "calls": statement.calls,
+                "total_ms": statement.seconds * 1000,
+                "avg_ms": statement.seconds * 1000 / statement.calls,
+                "max_ms": statement.max_seconds * 1000,
+                "rows": statement.rows,
+                "params": statement.shape,
+            }
+            if explain_queries:
+                async with async_connection() as conn:
+                    entry["explain"] = await explain(conn, statement)
+            queries.append(entry)
+        report[label] = {
+            "requests": profile.requests,
+            "total_ms": profile.seconds * 1000,
+            "db_ms": profile.db_seconds * 1000,
+            "python_ms": (profile.seconds - profile.db_seconds) * 1000,
+            "db_share": profile.db_seconds / profile.seconds if profile.seconds else 0.0,
+            "queries": queries,
+        }
+    return {"slow_query_ms": SLOW_QUERY_MS, "routes": report}
+
+
+@router.delete("/profile", status_code=204)
+async def reset_profile() -> Response:
+    _routes.clear()
+    return Response(status_code=204)
+
+
+__all__ = [
+    "PROFILE_SQL",
+    "SLOW_QUERY_MS",
+    "ProfileMiddleware",
+    "params_shape",
+    "record_query",
+    "router",
+]
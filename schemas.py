@@ -1,6 +1,6 @@
 """Pydantic schemas for the Glowac API."""
 
-from typing import Optional
+from typing import Any, Optional
 
 from pydantic import BaseModel
 from datetime import datetime
@@ -156,3 +156,143 @@ class GeotechRequest(BaseModel):
 
 
 __all__.append("GeotechRequest")
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    payload: dict
+    result: Optional[dict] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+__all__.append("Job")
+
+
+class JobStats(BaseModel):
+    kind: str
+    status: str
+    count: int
+    oldest_wait_seconds: Optional[float] = None
+    avg_run_seconds_last_hour: Optional[float] = None
+
+
+__all__.append("JobStats")
+
+
+class Homepage(BaseModel):
+    """Sections returned by GET /homepage; sections not requested are omitted."""
+
+    banners: Optional[list[Banner]] = None
+    tus: Optional[list[Tus]] = None
+    facts: Optional[list[Fact]] = None
+    why: Optional[list[Why]] = None
+    background: Optional[list[Background]] = None
+    core_values: Optional[list[CoreValue]] = None
+    ceo: Optional[list[CEO]] = None
+    members: Optional[list[Member]] = None
+    main_services: Optional[list[MainService]] = None
+    gallery: Optional[list[Gallery]] = None
+
+
+__all__.append("Homepage")
+
+
+class SubServiceTree(SubService):
+    tests: list[ServiceTest] = []
+
+
+__all__.append("SubServiceTree")
+
+
+class MainServiceTree(MainService):
+    sub_services: list[SubServiceTree] = []
+
+
+__all__.append("MainServiceTree")
+
+
+# Input rows for the bulk endpoints (see bulk.py); `id` is only read by the upsert endpoints.
+
+
+class TusCreate(BaseModel):
+    day: str
+    hours: str
+    status: str = "Open"
+
+
+class FactCreate(BaseModel):
+    label: str
+    number: int
+    status: str = "Visible"
+
+
+class WhyCreate(BaseModel):
+    label: str
+    value: str
+    status: str = "Visible"
+
+
+class CoreValueCreate(BaseModel):
+    bullet_text: str
+
+
+class BackgroundCreate(BaseModel):
+    paragraph: str
+
+
+class SubServiceCreate(BaseModel):
+    main_service_id: int
+    service_name: str
+    description: Optional[str] = None
+
+
+class ServiceTestCreate(BaseModel):
+    sub_service_id: int
+    test_name: str
+    description: Optional[str] = None
+
+
+__all__.extend(
+    [
+        "BackgroundCreate",
+        "CoreValueCreate",
+        "FactCreate",
+        "ServiceTestCreate",
+        "SubServiceCreate",
+        "TusCreate",
+        "WhyCreate",
+    ]
+)
+
+
+class BulkRowResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    item: Optional[Any] = None
+    errors: Optional[list[Any]] = None
+
+
+class BulkResult(BaseModel):
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    failed: int = 0
+    results: list[BulkRowResult]
+
+
+__all__.extend(["BulkResult", "BulkRowResult"])
+
+
+class BulkDelete(BaseModel):
+    ids: list[int]
+
+
+__all__.append("BulkDelete")
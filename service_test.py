@@ -2,111 +2,157 @@
 
 from typing import Optional
 
-from fastapi import APIRouter, Form, HTTPException
-
 import psycopg
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-from db import get_dsn
-from schemas import ServiceTest
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json_page
+from pagination import DEFAULT_PAGE_SIZE, Cursor, Page, PageSize, id_cursor, paginate
+from schemas import BulkDelete, BulkResult, ServiceTest, ServiceTestCreate
 
 router = APIRouter(prefix="/service-tests", tags=["service-test"])
 
+_PAGE_QUERY = """
+SELECT id, main_service_id, sub_service_id, test_name, description
+FROM service_test
+WHERE sub_service_id = %s AND id > %s
+ORDER BY id
+LIMIT %s
+"""
+
 
 @router.get("/by-sub/{sub_service_id}", response_model=list[ServiceTest])
-def list_tests_by_sub(sub_service_id: int) -> list[ServiceTest]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, main_service_id, sub_service_id, test_name, description FROM service_test WHERE sub_service_id = %s ORDER BY id",
-                (sub_service_id,),
-            )
-            rows = cur.fetchall()
-    return [ServiceTest(id=r[0], main_service_id=r[1], sub_service_id=r[2], test_name=r[3], description=r[4]) for r in rows]
+async def list_tests_by_sub(
+    sub_service_id: int, request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None
+) -> Response:
+    after_id = id_cursor(after)
+    return await cached_response(
+        request,
+        "service_test",
+        str(sub_service_id),
+        lambda: _load_tests_by_sub(sub_service_id, limit, after_id),
+    )
+
+
+async def _load_tests_by_sub(sub_service_id: int, limit: int, after_id: int) -> Page:
+    params = (sub_service_id, after_id, limit + 1)
+    if FAST_JSON:
+        return await fetch_json_page(_PAGE_QUERY, params, limit)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_PAGE_QUERY, params)
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: str(r[0]))
+    return Page(
+        [ServiceTest(id=r[0], main_service_id=r[1], sub_service_id=r[2], test_name=r[3], description=r[4]) for r in rows],
+        next_cursor,
+    )
 
 @router.post("", response_model=ServiceTest, status_code=201)
-def create_service_test(
+async def create_service_test(
     sub_service_id: int = Form(...),
     test_name: str = Form(...),
     description: Optional[str] = Form(None),
 ) -> ServiceTest:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
             # validate sub_service exists and fetch its main_service_id
-            cur.execute("SELECT main_service_id FROM sub_service WHERE id = %s", (sub_service_id,))
-            row = cur.fetchone()
+            await cur.execute("SELECT main_service_id FROM sub_service WHERE id = %s", (sub_service_id,))
+            row = await cur.fetchone()
             if row is None:
                 raise HTTPException(status_code=404, detail="Sub-service not found")
             main_service_id = row[0]
 
-            cur.execute(
+            await cur.execute(
                 "INSERT INTO service_test (main_service_id, sub_service_id, test_name, description) VALUES (%s, %s, %s, %s) RETURNING id, main_service_id, sub_service_id, test_name, description",
                 (main_service_id, sub_service_id, test_name, description),
             )
-            created = cur.fetchone()
+            created = await cur.fetchone()
     if created is None:
         raise HTTPException(status_code=500, detail="Failed to create service test")
+    response_cache.invalidate("service_test")
     return ServiceTest(id=created[0], main_service_id=created[1], sub_service_id=created[2], test_name=created[3], description=created[4])
 
 
 @router.get("/{test_id}", response_model=ServiceTest)
-def get_service_test(test_id: int) -> ServiceTest:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, main_service_id, sub_service_id, test_name, description FROM service_test WHERE id = %s", (test_id,))
-            row = cur.fetchone()
+async def get_service_test(test_id: int) -> ServiceTest:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, main_service_id, sub_service_id, test_name, description FROM service_test WHERE id = %s", (test_id,))
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=404, detail="Service test not found")
     return ServiceTest(id=row[0], main_service_id=row[1], sub_service_id=row[2], test_name=row[3], description=row[4])
 
 
 @router.put("/{test_id}", response_model=ServiceTest)
-def update_service_test(
+@router.patch("/{test_id}", response_model=ServiceTest)
+async def update_service_test(
     test_id: int,
     sub_service_id: Optional[int] = Form(None),
     test_name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
 ) -> ServiceTest:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT main_service_id, sub_service_id, test_name, description FROM service_test WHERE id = %s", (test_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Service test not found")
-            # determine new sub and main; if sub_service_id provided, validate and derive main
-            new_sub = sub_service_id if sub_service_id is not None else current[1]
-            if sub_service_id is not None:
-                cur.execute("SELECT main_service_id FROM sub_service WHERE id = %s", (new_sub,))
-                sub_row = cur.fetchone()
-                if sub_row is None:
-                    raise HTTPException(status_code=404, detail="Sub-service not found")
-                new_main = sub_row[0]
-            else:
-                new_main = current[0]
-
-            cur.execute(
-                "UPDATE service_test SET main_service_id = %s, sub_service_id = %s, test_name = %s, description = %s WHERE id = %s RETURNING id, main_service_id, sub_service_id, test_name, description",
-                (
-                    new_main,
-                    new_sub,
-                    test_name if test_name is not None else current[2],
-                    description if description is not None else current[3],
-                    test_id,
-                ),
-            )
-            updated = cur.fetchone()
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            # moving to another sub-service also moves the test under that sub-service's main service
+            try:
+                await cur.execute(
+                    """
+                    UPDATE service_test
+                    SET main_service_id = COALESCE((SELECT main_service_id FROM sub_service WHERE id = %(sub)s), main_service_id),
+                        sub_service_id = COALESCE(%(sub)s, sub_service_id),
+                        test_name = COALESCE(%(name)s, test_name),
+                        description = COALESCE(%(description)s, description)
+                    WHERE id = %(id)s
+                    RETURNING id, main_service_id, sub_service_id, test_name, description
+                    """,
+                    {"sub": sub_service_id, "name": test_name, "description": description, "id": test_id},
+                )
+            except psycopg.errors.ForeignKeyViolation:
+                raise HTTPException(status_code=404, detail="Sub-service not found")
+            updated = await cur.fetchone()
     if updated is None:
-        raise HTTPException(status_code=500, detail="Failed to update service test")
+        raise HTTPException(status_code=404, detail="Service test not found")
+    response_cache.invalidate("service_test")
     return ServiceTest(id=updated[0], main_service_id=updated[1], sub_service_id=updated[2], test_name=updated[3], description=updated[4])
 
 
 @router.delete("/{test_id}", status_code=204)
-def delete_service_test(test_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM service_test WHERE id = %s", (test_id,))
+async def delete_service_test(test_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM service_test WHERE id = %s", (test_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Service test not found")
+    response_cache.invalidate("service_test")
     return None
 
 
+_BULK = BulkSpec(
+    "service_test",
+    ServiceTestCreate,
+    "id, main_service_id, sub_service_id, test_name, description",
+    lambda r: ServiceTest(id=r[0], main_service_id=r[1], sub_service_id=r[2], test_name=r[3], description=r[4]),
+    values={"main_service_id": "s.main_service_id", "sub_service_id": "s.id"},
+    source="FROM sub_service s WHERE s.id = %(sub_service_id)s",
+)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201, openapi_extra=bulk_openapi(ServiceTestCreate))
+async def bulk_create_service_tests(request: Request) -> BulkResult:
+    return await bulk_insert(_BULK, await read_rows(request, ServiceTestCreate))
+
+
+@router.post("/bulk/upsert", response_model=BulkResult, openapi_extra=bulk_openapi(_BULK.upsert_model))
+async def bulk_upsert_service_tests(request: Request) -> BulkResult:
+    return await bulk_upsert(_BULK, await read_rows(request, _BULK.upsert_model))
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_service_tests(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]
@@ -0,0 +1,73 @@
+"""Nested service catalogue: main services with their sub-services and tests."""
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from psycopg import sql
+
+from cache import cached_response, response_cache
+from db import async_connection
+from schemas import MainServiceTree
+
+router = APIRouter(prefix="/services", tags=["services"])
+
+# Postgres builds the whole tree as one JSON document. The correlated
+# subqueries run on the (main_service_id, id) and (sub_service_id, id)
+# indexes, and the text is sent to the client as-is.
+_TREE_QUERY = sql.SQL(
+    """
+    SELECT COALESCE(json_agg(tree ORDER BY tree.id), '[]')::text
+    FROM (
+        SELECT m.id,
+               m.service_name,
+               COALESCE((
+                   SELECT json_agg(json_build_object(
+                              'id', s.id,
+                              'main_service_id', s.main_service_id,
+                              'service_name', s.service_name,
+                              'description', s.description,
+                              'tests', COALESCE((
+                                  SELECT json_agg(json_build_object(
+                                             'id', t.id,
+                                             'main_service_id', t.main_service_id,
+                                             'sub_service_id', t.sub_service_id,
+                                             'test_name', t.test_name,
+                                             'description', t.description
+                                         ) ORDER BY t.id)
+                                  FROM service_test t
+                                  WHERE t.sub_service_id = s.id
+                              ), '[]')
+                          ) ORDER BY s.id)
+                   FROM sub_service s
+                   WHERE s.main_service_id = m.id
+               ), '[]') AS sub_services
+        FROM main_service m
+        {where}
+    ) AS tree
+    """
+)
+
+response_cache.depends_on("service_tree", ("main_service", "sub_service", "service_test"))
+
+
+@router.get("/tree", response_model=list[MainServiceTree])
+async def get_service_tree(
+    request: Request,
+    main_id: Optional[int] = Query(None, description="Only return this main service"),
+) -> Response:
+    return await cached_response(request, "service_tree", str(main_id), lambda: _load_tree(main_id))
+
+
+async def _load_tree(main_id: Optional[int]) -> bytes:
+    where = sql.SQL("WHERE m.id = %s") if main_id is not None else sql.SQL("")
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_TREE_QUERY.format(where=where), (main_id,) if main_id is not None else None)
+            row = await cur.fetchone()
+    body = row[0]
+    if main_id is not None and body == "[]":
+        raise HTTPException(status_code=404, detail="Service not found")
+    return body.encode()
+
+
+__all__ = ["router"]
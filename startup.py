@@ -0,0 +1,161 @@
+"""Cold-start helpers: lazily included routers and a pre-built OpenAPI document.
+
+With LAZY_ROUTERS=1 the app starts without importing any router module; the
+first request under a router's prefix imports it and adds its routes (see
+``LazyRouterMiddleware``). ``/openapi.json`` and ``/docs`` are served from a
+document cached on disk in OPENAPI_CACHE_DIR (default ``.openapi`` next to
+this file), keyed by a hash of the source files and of the settings that
+change the routes or their schema (OPENAPI_SETTINGS), so only the first
+worker after a deploy or configuration change builds it. Build it ahead of time with::
+
+    python startup.py openapi
+
+``python startup.py imports`` prints how long ``import main`` spends in each
+module (from ``python -X importtime``).
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+import fastapi
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent
+LAZY_ROUTERS = (os.getenv("LAZY_ROUTERS") or "0") not in ("0", "false", "no")
+OPENAPI_CACHE_DIR = Path(os.getenv("OPENAPI_CACHE_DIR") or APP_DIR / ".openapi")
+# environment variables that add routes (PROFILE_SQL mounts /debug) or appear in the schema
+OPENAPI_SETTINGS = (
+    "PROFILE_SQL",
+    "PROFILE_MAX_STATEMENTS",
+    "LAZY_ROUTERS",
+    "DEFAULT_PAGE_SIZE",
+    "MAX_PAGE_SIZE",
+    "EXPORT_MAX_CONCURRENT",
+)
+
+
+class LazyRouterMiddleware:
+    """Call ``load(module)`` for the modules mapped to a path prefix on the first request under it."""
+
+    def __init__(self, app: ASGIApp, routers: Mapping[str, Sequence[str]], load: Callable[[str], None]) -> None:
+        self.app = app
+        self.pending: Dict[str, Sequence[str]] = dict(routers)
+        self.load = load
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.pending and scope["type"] in ("http", "websocket"):
+            path = scope["path"]
+            for prefix in [p for p in self.pending if path == p or path.startswith(p + "/")]:
+                # no await between the check and the import, so concurrent first requests load it once
+                for module in self.pending.pop(prefix):
+                    self.load(module)
+        await self.app(scope, receive, send)
+
+
+def source_fingerprint() -> str:
+    """Hash of the application sources, settings and FastAPI version the OpenAPI document is built from."""
+
+    digest = hashlib.sha256(fastapi.__version__.encode())
+    for name in OPENAPI_SETTINGS:
+        digest.update(f"{name}={os.getenv(name) or ''}\n".encode())
+    for path in sorted(APP_DIR.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def openapi_cache_path() -> Path:
+    return OPENAPI_CACHE_DIR / f"openapi-{source_fingerprint()}.json"
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".openapi-")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def cached_openapi(app: FastAPI, load_all: Callable[[], None]) -> Callable[[], Dict[str, Any]]:
+    """Return a replacement for ``app.openapi`` that reads the cached document, building it when missing."""
+
+    generate = app.openapi
+
+    def openapi() -> Dict[str, Any]:
+        if app.openapi_schema is None:
+            path = openapi_cache_path()
+            try:
+                app.openapi_schema = json.loads(path.read_bytes())
+            except (OSError, ValueError):
+                load_all()
+                schema = generate()
+                try:
+                    _write_atomic(path, json.dumps(schema).encode())
+                except OSError as exc:
+                    logger.warning("Could not cache the OpenAPI document in %s: %s", path, exc)
+        return app.openapi_schema
+
+    return openapi
+
+
+def import_times(lazy: bool = False) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """Run ``import main`` under ``-X importtime``; return its wall time and (cumulative us, self us, module) rows."""
+
+    env = {**os.environ, "LAZY_ROUTERS": "1" if lazy else "0"}
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (.*)$", line)
+        if match:
+            rows.append((int(match.group(2)), int(match.group(1)), match.group(3)))
+    return float(proc.stdout.strip()), rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold-start tooling for the API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("openapi", help="build the cached OpenAPI document")
+    imports = commands.add_parser("imports", help="report where `import main` spends its time")
+    imports.add_argument("--top", type=int, default=25)
+    imports.add_argument("--lazy", action="store_true", help="with LAZY_ROUTERS=1")
+    args = parser.parse_args()
+
+    if args.command == "openapi":
+        from main import app
+
+        app.openapi()
+        print(f"OpenAPI document cached in {openapi_cache_path()}")
+    else:
+        wall, rows = import_times(args.lazy)
+        print(f"import main: {wall * 1000:.0f} ms")
+        print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+        for cumulative, own, module in sorted(rows, reverse=True)[: args.top]:
+            print(f"{cumulative / 1000:14.1f} {own / 1000:8.1f}  {module}")
+
+
+__all__ = ["LAZY_ROUTERS", "LazyRouterMiddleware", "cached_openapi", "import_times", "openapi_cache_path"]
+
+
+if __name__ == "__main__":
+    main()
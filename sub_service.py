@@ -2,103 +2,161 @@
 
 from typing import Optional
 
-from fastapi import APIRouter, Form, HTTPException
-
 import psycopg
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-from db import get_dsn
-from schemas import SubService
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json_page
+from pagination import DEFAULT_PAGE_SIZE, Cursor, Page, PageSize, id_cursor, paginate
+from schemas import BulkDelete, BulkResult, SubService, SubServiceCreate
 
 router = APIRouter(prefix="/sub-services", tags=["sub-service"])
 
+_PAGE_QUERY = """
+SELECT id, main_service_id, service_name, description
+FROM sub_service
+WHERE main_service_id = %s AND id > %s
+ORDER BY id
+LIMIT %s
+"""
+
 
 @router.get("/by-main/{main_service_id}", response_model=list[SubService])
-def list_sub_services_by_main(main_service_id: int) -> list[SubService]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id, main_service_id, service_name, description FROM sub_service WHERE main_service_id = %s ORDER BY id",
-                (main_service_id,),
-            )
-            rows = cur.fetchall()
-    return [SubService(id=r[0], main_service_id=r[1], service_name=r[2], description=r[3]) for r in rows]
+async def list_sub_services_by_main(
+    main_service_id: int, request: Request, limit: PageSize = DEFAULT_PAGE_SIZE, after: Cursor = None
+) -> Response:
+    after_id = id_cursor(after)
+    return await cached_response(
+        request,
+        "sub_service",
+        str(main_service_id),
+        lambda: _load_sub_services_by_main(main_service_id, limit, after_id),
+    )
+
+
+async def _load_sub_services_by_main(main_service_id: int, limit: int, after_id: int) -> Page:
+    params = (main_service_id, after_id, limit + 1)
+    if FAST_JSON:
+        return await fetch_json_page(_PAGE_QUERY, params, limit)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_PAGE_QUERY, params)
+            rows, next_cursor = paginate(await cur.fetchall(), limit, lambda r: str(r[0]))
+    return Page([SubService(id=r[0], main_service_id=r[1], service_name=r[2], description=r[3]) for r in rows], next_cursor)
 
 
 @router.post("/by-main/{main_service_id}", response_model=SubService, status_code=201)
-def create_sub_service_for_main(
+async def create_sub_service_for_main(
     main_service_id: int, service_name: str = Form(...), description: Optional[str] = Form(None)
 ) -> SubService:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
             # ensure main service exists
-            cur.execute("SELECT id FROM main_service WHERE id = %s", (main_service_id,))
-            if cur.fetchone() is None:
+            await cur.execute("SELECT id FROM main_service WHERE id = %s", (main_service_id,))
+            if await cur.fetchone() is None:
                 raise HTTPException(status_code=404, detail="Main service not found")
-            cur.execute(
+            await cur.execute(
                 "INSERT INTO sub_service (main_service_id, service_name, description) VALUES (%s, %s, %s) RETURNING id, main_service_id, service_name, description",
                 (main_service_id, service_name, description),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create sub-service")
+    response_cache.invalidate("sub_service")
     return SubService(id=row[0], main_service_id=row[1], service_name=row[2], description=row[3])
 
 
 @router.get("/{sub_id}", response_model=SubService)
-def get_sub_service(sub_id: int) -> SubService:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, main_service_id, service_name, description FROM sub_service WHERE id = %s", (sub_id,))
-            row = cur.fetchone()
+async def get_sub_service(sub_id: int) -> SubService:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT id, main_service_id, service_name, description FROM sub_service WHERE id = %s", (sub_id,))
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=404, detail="Sub-service not found")
     return SubService(id=row[0], main_service_id=row[1], service_name=row[2], description=row[3])
 
 
 @router.put("/{sub_id}", response_model=SubService)
-def update_sub_service(
+@router.patch("/{sub_id}", response_model=SubService)
+async def update_sub_service(
     sub_id: int,
     main_service_id: Optional[int] = Form(None),
     service_name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
 ) -> SubService:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT main_service_id, service_name, description FROM sub_service WHERE id = %s", (sub_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Sub-service not found")
-
-            new_main = main_service_id if main_service_id is not None else current[0]
-            # if main_service_id changed, ensure target main exists
-            if main_service_id is not None:
-                cur.execute("SELECT id FROM main_service WHERE id = %s", (main_service_id,))
-                if cur.fetchone() is None:
-                    raise HTTPException(status_code=404, detail="Target main service not found")
-
-            cur.execute(
-                "UPDATE sub_service SET main_service_id = %s, service_name = %s, description = %s WHERE id = %s RETURNING id, main_service_id, service_name, description",
-                (
-                    new_main,
-                    service_name if service_name is not None else current[1],
-                    description if description is not None else current[2],
-                    sub_id,
-                ),
-            )
-            row = cur.fetchone()
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            try:
+                await cur.execute(
+                    """
+                    UPDATE sub_service
+                    SET main_service_id = COALESCE(%s, main_service_id),
+                        service_name = COALESCE(%s, service_name),
+                        description = COALESCE(%s, description)
+                    WHERE id = %s
+                    RETURNING id, main_service_id, service_name, description
+                    """,
+                    (main_service_id, service_name, description, sub_id),
+                )
+            except psycopg.errors.ForeignKeyViolation:
+                raise HTTPException(status_code=404, detail="Target main service not found")
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update sub-service")
+        raise HTTPException(status_code=404, detail="Sub-service not found")
+    response_cache.invalidate("sub_service")
     return SubService(id=row[0], main_service_id=row[1], service_name=row[2], description=row[3])
 
 
 @router.delete("/{sub_id}", status_code=204)
-def delete_sub_service(sub_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM sub_service WHERE id = %s", (sub_id,))
+async def delete_sub_service(sub_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM sub_service WHERE id = %s", (sub_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Sub-service not found")
+    response_cache.invalidate("sub_service")
+    response_cache.invalidate("service_test")
     return None
 
 
+_BULK = BulkSpec(
+    "sub_service",
+    SubServiceCreate,
+    "id, main_service_id, service_name, description",
+    lambda r: SubService(id=r[0], main_service_id=r[1], service_name=r[2], description=r[3]),
+    values={"main_service_id": "m.id"},
+    source="FROM main_service m WHERE m.id = %(main_service_id)s",
+    invalidates=("service_test",),
+)
+
+
+@router.post(
+    "/by-main/{main_service_id}/bulk",
+    response_model=BulkResult,
+    status_code=201,
+    openapi_extra=bulk_openapi(SubServiceCreate),
+)
+async def bulk_create_sub_services(main_service_id: int, request: Request) -> BulkResult:
+    rows = await read_rows(request, SubServiceCreate, {"main_service_id": main_service_id})
+    return await bulk_insert(_BULK, rows)
+
+
+@router.post(
+    "/by-main/{main_service_id}/bulk/upsert",
+    response_model=BulkResult,
+    openapi_extra=bulk_openapi(_BULK.upsert_model),
+)
+async def bulk_upsert_sub_services(main_service_id: int, request: Request) -> BulkResult:
+    rows = await read_rows(request, _BULK.upsert_model, {"main_service_id": main_service_id})
+    return await bulk_upsert(_BULK, rows)
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_sub_services(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import bulk
+from schemas import FactCreate
+
+app = FastAPI()
+
+
+@app.post("/bulk")
+async def post_rows(request: Request) -> int:
+    return len(await bulk.read_rows(request, FactCreate))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_MAX_BYTES", 1024)
+    return TestClient(app)
+
+
+def _rows(count: int) -> bytes:
+    return json.dumps([{"label": f"Fact {i}", "number": str(i), "status": "Visible"} for i in range(count)]).encode()
+
+
+def test_read_rows_within_limit(client):
+    response = client.post("/bulk", content=_rows(3), headers={"content-type": "application/json"})
+    assert response.status_code == 200
+    assert response.json() == 3
+
+
+def test_read_rows_rejects_declared_oversized_body(client):
+    response = client.post("/bulk", content=_rows(100), headers={"content-type": "application/json"})
+    assert response.status_code == 413
+
+
+def test_read_rows_rejects_oversized_chunked_body(client):
+    body = _rows(100)
+    chunks = (body[i : i + 256] for i in range(0, len(body), 256))
+    response = client.post("/bulk", content=chunks, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 413
@@ -0,0 +1,26 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from derivatives import VariantSpec, bucket_width, requested_variant
+
+
+def _request(query: bytes, accept: str = "") -> Request:
+    headers = [(b"accept", accept.encode())] if accept else []
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": query, "headers": headers})
+
+
+def test_requested_variant_resizes_in_source_format():
+    spec, _ = requested_variant(_request(b"w=300"), "image/png")
+    assert spec == VariantSpec(bucket_width(300), "png")
+
+
+def test_requested_variant_without_width_serves_original():
+    assert requested_variant(_request(b""), "image/jpeg") == (None, False)
+
+
+@pytest.mark.parametrize("query", [b"w=0", b"w=-5", b"w=abc", b"w=%C2%B2", b"w=%D9%A1%D9%A2", b"w=" + b"9" * 5000])
+def test_requested_variant_rejects_invalid_widths(query):
+    with pytest.raises(HTTPException) as exc:
+        requested_variant(_request(query), "image/jpeg")
+    assert exc.value.status_code == 400
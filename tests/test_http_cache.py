@@ -0,0 +1,27 @@
+import pytest
+
+from http_cache import RangeNotSatisfiable, parse_range
+
+
+def test_parse_range_spans():
+    assert parse_range("bytes=0-3", 10) == [(0, 4)]
+    assert parse_range("bytes=5-", 10) == [(5, 10)]
+    assert parse_range("bytes=-4", 10) == [(6, 10)]
+    assert parse_range("bytes=2-3, 8-20", 10) == [(2, 4), (8, 10)]
+
+
+def test_parse_range_ignores_malformed_headers():
+    assert parse_range(None, 10) is None
+    assert parse_range("items=0-3", 10) is None
+    assert parse_range("bytes=3-1", 10) is None
+    assert parse_range("bytes=a-", 10) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=0-²", "bytes=²-", "bytes=-²", "bytes=١-٢"])
+def test_parse_range_ignores_non_ascii_digits(header):
+    assert parse_range(header, 10) is None
+
+
+def test_parse_range_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=20-", 10)
@@ -0,0 +1,152 @@
+"""Optional OpenTelemetry tracing.
+
+Off unless OTEL_TRACES_EXPORTER is set to ``otlp`` (OTLP over HTTP; endpoint
+and headers from the standard OTEL_EXPORTER_OTLP_* variables), ``console`` or
+``file`` (one JSON span per line appended to OTEL_TRACES_FILE, default
+``traces.jsonl``). While off, ``span()`` returns a shared no-op context manager
+and the OpenTelemetry SDK (an optional dependency) is never imported.
+
+The span per request (and its endpoint and serialization children) comes from
+FastAPI's built-in telemetry, which follows the tracer provider installed here;
+``TracingMiddleware`` adds the request and response body sizes to it. This
+module adds child spans for pool checkouts and every query (see db.py) and
+for loading and serializing cached list responses (see cache.py). Call
+``configure_tracing`` before the first request; tests can capture spans in
+memory::
+
+    exporter = InMemorySpanExporter()
+    configure_tracing(exporter=exporter)
+"""
+
+import os
+import re
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+OTEL_TRACES_EXPORTER = (os.getenv("OTEL_TRACES_EXPORTER") or "none").lower()
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE") or "traces.jsonl"
+
+_NOOP: ContextManager[Any] = nullcontext()
+_provider: Any = None
+_tracer: Any = None
+
+_QUERY_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?([a-z_]\w*)", re.I)
+
+
+def _exporter(name: str) -> Any:
+    if name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "file":
+        out = open(OTEL_TRACES_FILE, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    raise SystemExit(f"Unknown OTEL_TRACES_EXPORTER {name!r}; expected otlp, console, file or none.")
+
+
+def configure_tracing(exporter: Any = None) -> bool:
+    """Enable tracing with *exporter*, or the one named by OTEL_TRACES_EXPORTER; return whether it is on.
+
+    An exporter passed in (e.g. an ``InMemorySpanExporter``) gets every span
+    synchronously; the configured ones are batched.
+    """
+
+    global _provider, _tracer
+    if exporter is None and OTEL_TRACES_EXPORTER == "none":
+        return False
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+    except ImportError as exc:  # pragma: no cover - dependency guidance
+        raise SystemExit(
+            "Tracing needs the OpenTelemetry SDK: pip install opentelemetry-sdk opentelemetry-exporter-otlp-proto-http"
+        ) from exc
+
+    if _provider is None:
+        # the global provider can only be set once; later calls add exporters to it
+        _provider = TracerProvider(
+            resource=Resource.create({SERVICE_NAME: os.getenv("OTEL_SERVICE_NAME") or "glowac-api"})
+        )
+        trace.set_tracer_provider(_provider)
+        _tracer = _provider.get_tracer("glowac")
+    if exporter is not None:
+        _provider.add_span_processor(SimpleSpanProcessor(exporter))
+    else:
+        _provider.add_span_processor(BatchSpanProcessor(_exporter(OTEL_TRACES_EXPORTER)))
+    return True
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, attributes: Optional[Dict[str, Any]] = None) -> ContextManager[Any]:
+    """Start a child span of the current one; a no-op (yielding None) while tracing is off."""
+
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+def query_text(query: Any, context: Any) -> str:
+    """Return the SQL of *query* (a string, bytes or ``psycopg.sql`` object) as text."""
+
+    text = query.as_string(context) if hasattr(query, "as_string") else query
+    return text.decode() if isinstance(text, bytes) else str(text)
+
+
+def query_span(query: Any, context: Any) -> ContextManager[Any]:
+    """Span for one statement, named like ``SELECT service_test``; *context* renders composed queries."""
+
+    if _tracer is None:
+        return _NOOP
+    text = query_text(query, context)
+    operation = (text.split(None, 1) or ["query"])[0].upper()
+    attributes = {"db.system.name": "postgresql", "db.operation.name": operation, "db.query.text": text[:2048]}
+    match = _QUERY_TABLE.search(text)
+    if match is None:
+        return span(operation, attributes)
+    attributes["db.collection.name"] = match.group(1)
+    return span(f"{operation} {match.group(1)}", attributes)
+
+
+class TracingMiddleware:
+    """Record request and response body sizes on the current request span."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if _tracer is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        from opentelemetry import trace
+
+        current = trace.get_current_span()
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit():
+                current.set_attribute("http.request.body.size", int(value))
+        sent = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal sent
+            if message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+                # FastAPI ends the span once the last chunk is sent
+                if not message.get("more_body", False):
+                    current.set_attribute("http.response.body.size", sent)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+__all__ = ["TracingMiddleware", "configure_tracing", "enabled", "query_span", "query_text", "span"]
@@ -1,83 +1,110 @@
 """Routes for managing tus (opening-hours) entries."""
 
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-import psycopg
-
-from db import get_dsn
-from schemas import Tus
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json
+from schemas import BulkDelete, BulkResult, Tus, TusCreate
 
 router = APIRouter(prefix="/tus", tags=["tus"])
 
+_LIST_QUERY = "SELECT id, day, hours, status FROM tus ORDER BY id"
+
 
 @router.get("", response_model=list[Tus])
-def list_tus() -> list[Tus]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, day, hours, status FROM tus ORDER BY id")
-            rows = cur.fetchall()
+async def list_tus(request: Request) -> Response:
+    return await cached_response(request, "tus", "", _load_tus)
+
+
+async def _load_tus() -> Union[list[Tus], bytes]:
+    if FAST_JSON:
+        return await fetch_json(_LIST_QUERY)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_LIST_QUERY)
+            rows = await cur.fetchall()
     return [Tus(id=r[0], day=r[1], hours=r[2], status=r[3]) for r in rows]
 
 
 @router.post("", response_model=Tus, status_code=201)
-def create_tus(day: str = Form(...), hours: str = Form(...), status: str = Form("Open")) -> Tus:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def create_tus(day: str = Form(...), hours: str = Form(...), status: str = Form("Open")) -> Tus:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO tus (day, hours, status) VALUES (%s, %s, %s) RETURNING id, day, hours, status",
                 (day, hours, status),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create tus entry")
+    response_cache.invalidate("tus")
     return Tus(id=row[0], day=row[1], hours=row[2], status=row[3])
 
 
 @router.put("/{tus_id}", response_model=Tus)
-def update_tus(
+@router.patch("/{tus_id}", response_model=Tus)
+async def update_tus(
     tus_id: int,
     day: Optional[str] = Form(None),
     hours: Optional[str] = Form(None),
     status: Optional[str] = Form(None),
 ) -> Tus:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT day, hours, status FROM tus WHERE id = %s", (tus_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="tus entry not found")
-            cur.execute(
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE tus
-                SET day = %s,
-                    hours = %s,
-                    status = %s
+                SET day = COALESCE(%s, day),
+                    hours = COALESCE(%s, hours),
+                    status = COALESCE(%s, status)
                 WHERE id = %s
                 RETURNING id, day, hours, status
                 """,
-                (
-                    day if day is not None else current[0],
-                    hours if hours is not None else current[1],
-                    status if status is not None else current[2],
-                    tus_id,
-                ),
+                (day, hours, status, tus_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update tus entry")
+        raise HTTPException(status_code=404, detail="tus entry not found")
+    response_cache.invalidate("tus")
     return Tus(id=row[0], day=row[1], hours=row[2], status=row[3])
 
 
 @router.delete("/{tus_id}", status_code=204)
-def delete_tus(tus_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM tus WHERE id = %s", (tus_id,))
+async def delete_tus(tus_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM tus WHERE id = %s", (tus_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="tus entry not found")
+    response_cache.invalidate("tus")
     return None
 
 
+_BULK = BulkSpec(
+    "tus",
+    TusCreate,
+    "id, day, hours, status",
+    lambda r: Tus(id=r[0], day=r[1], hours=r[2], status=r[3]),
+)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201, openapi_extra=bulk_openapi(TusCreate))
+async def bulk_create_tus(request: Request) -> BulkResult:
+    return await bulk_insert(_BULK, await read_rows(request, TusCreate))
+
+
+@router.post("/bulk/upsert", response_model=BulkResult, openapi_extra=bulk_openapi(_BULK.upsert_model))
+async def bulk_upsert_tus(request: Request) -> BulkResult:
+    return await bulk_upsert(_BULK, await read_rows(request, _BULK.upsert_model))
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_tus(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]
@@ -0,0 +1,67 @@
+"""Request-size limits for image uploads.
+
+MAX_UPLOAD_BYTES (default 20 MiB) caps the size of a single uploaded image.
+Multipart request bodies may exceed it by FORM_OVERHEAD_BYTES to leave room
+for the boundaries and the text fields sent alongside the image.
+"""
+
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES") or 20 * 1024 * 1024)
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+_UPLOAD_METHODS = {"POST", "PUT", "PATCH"}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+
+
+class UploadLimitMiddleware:
+    """Reject multipart bodies larger than the upload limit while they are being received.
+
+    A declared Content-Length over the limit is refused before any of the body
+    is read; chunked or understated bodies are counted as they arrive and fail
+    as soon as the limit is crossed, so an oversized upload is never spooled in
+    full.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_size: int = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES) -> None:
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in _UPLOAD_METHODS:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_body_size:
+            error = _too_large()
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # FastAPI re-raises HTTPExceptions from form parsing instead of turning them into a 400.
+                    raise _too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+__all__ = ["FORM_OVERHEAD_BYTES", "MAX_UPLOAD_BYTES", "UploadLimitMiddleware"]
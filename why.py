@@ -1,83 +1,110 @@
 """Routes for managing 'Why Choose Us' entries."""
 
-from typing import Optional
+from typing import Optional, Union
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Request, Response
 
-import psycopg
-
-from db import get_dsn
-from schemas import Why
+from bulk import BulkSpec, bulk_delete, bulk_insert, bulk_openapi, bulk_upsert, read_rows
+from cache import cached_response, response_cache
+from db import async_connection
+from fast_json import FAST_JSON, fetch_json
+from schemas import BulkDelete, BulkResult, Why, WhyCreate
 
 router = APIRouter(prefix="/why", tags=["why"])
 
+_LIST_QUERY = "SELECT id, label, value, status FROM why_choose_us ORDER BY id"
+
 
 @router.get("", response_model=list[Why])
-def list_why() -> list[Why]:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, label, value, status FROM why_choose_us ORDER BY id")
-            rows = cur.fetchall()
+async def list_why(request: Request) -> Response:
+    return await cached_response(request, "why_choose_us", "", _load_why)
+
+
+async def _load_why() -> Union[list[Why], bytes]:
+    if FAST_JSON:
+        return await fetch_json(_LIST_QUERY)
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(_LIST_QUERY)
+            rows = await cur.fetchall()
     return [Why(id=r[0], label=r[1], value=r[2], status=r[3]) for r in rows]
 
 
 @router.post("", response_model=Why, status_code=201)
-def create_why(label: str = Form(...), value: str = Form(...), status: str = Form("Visible")) -> Why:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+async def create_why(label: str = Form(...), value: str = Form(...), status: str = Form("Visible")) -> Why:
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 "INSERT INTO why_choose_us (label, value, status) VALUES (%s, %s, %s) RETURNING id, label, value, status",
                 (label, value, status),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to create why entry")
+    response_cache.invalidate("why_choose_us")
     return Why(id=row[0], label=row[1], value=row[2], status=row[3])
 
 
 @router.put("/{why_id}", response_model=Why)
-def update_why(
+@router.patch("/{why_id}", response_model=Why)
+async def update_why(
     why_id: int,
     label: Optional[str] = Form(None),
     value: Optional[str] = Form(None),
     status: Optional[str] = Form(None),
 ) -> Why:
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT label, value, status FROM why_choose_us WHERE id = %s", (why_id,))
-            current = cur.fetchone()
-            if current is None:
-                raise HTTPException(status_code=404, detail="Why entry not found")
-            cur.execute(
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 """
                 UPDATE why_choose_us
-                SET label = %s,
-                    value = %s,
-                    status = %s
+                SET label = COALESCE(%s, label),
+                    value = COALESCE(%s, value),
+                    status = COALESCE(%s, status)
                 WHERE id = %s
                 RETURNING id, label, value, status
                 """,
-                (
-                    label if label is not None else current[0],
-                    value if value is not None else current[1],
-                    status if status is not None else current[2],
-                    why_id,
-                ),
+                (label, value, status, why_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=500, detail="Failed to update why entry")
+        raise HTTPException(status_code=404, detail="Why entry not found")
+    response_cache.invalidate("why_choose_us")
     return Why(id=row[0], label=row[1], value=row[2], status=row[3])
 
 
 @router.delete("/{why_id}", status_code=204)
-def delete_why(why_id: int):
-    with psycopg.connect(get_dsn()) as conn:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM why_choose_us WHERE id = %s", (why_id,))
+async def delete_why(why_id: int):
+    async with async_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("DELETE FROM why_choose_us WHERE id = %s", (why_id,))
             if cur.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Why entry not found")
+    response_cache.invalidate("why_choose_us")
     return None
 
 
+_BULK = BulkSpec(
+    "why_choose_us",
+    WhyCreate,
+    "id, label, value, status",
+    lambda r: Why(id=r[0], label=r[1], value=r[2], status=r[3]),
+)
+
+
+@router.post("/bulk", response_model=BulkResult, status_code=201, openapi_extra=bulk_openapi(WhyCreate))
+async def bulk_create_why(request: Request) -> BulkResult:
+    return await bulk_insert(_BULK, await read_rows(request, WhyCreate))
+
+
+@router.post("/bulk/upsert", response_model=BulkResult, openapi_extra=bulk_openapi(_BULK.upsert_model))
+async def bulk_upsert_why(request: Request) -> BulkResult:
+    return await bulk_upsert(_BULK, await read_rows(request, _BULK.upsert_model))
+
+
+@router.post("/bulk/delete", response_model=BulkResult)
+async def bulk_delete_why(body: BulkDelete) -> BulkResult:
+    return await bulk_delete(_BULK, body.ids)
+
+
 __all__ = ["router"]